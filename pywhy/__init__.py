@@ -6,21 +6,29 @@ This package provides:
 - Instrumenter: Transforms code to add tracing
 - Questions: Ask why/why not questions about execution
 - UI: Simple interface for interactive debugging
-"""
 
-from .tracer import WhylineTracer, get_tracer, start_tracing, stop_tracing
-from .instrumenter import instrument_code, instrument_file, exec_instrumented
-from .questions import QuestionAsker, Question, Answer
+Submodules are imported lazily on first attribute access (PEP 562), so
+`import pywhy` stays cheap and the CLI starts without loading the UIs.
+"""
 
-# Import UI components conditionally
-try:
-    from .ui import WhylineUI
-    UI_AVAILABLE = True
-except ImportError:
-    UI_AVAILABLE = False
-    WhylineUI = None
+from importlib import import_module
 
-from .cli import WhylineCLI
+# Public name -> submodule that defines it
+_LAZY_ATTRIBUTES = {
+    "WhylineTracer": ".tracer",
+    "get_tracer": ".tracer",
+    "start_tracing": ".tracer",
+    "stop_tracing": ".tracer",
+    "instrument_code": ".instrumenter",
+    "instrument_ast": ".instrumenter",
+    "instrument_file": ".instrumenter",
+    "instrument_files": ".instrumenter",
+    "exec_instrumented": ".instrumenter",
+    "QuestionAsker": ".questions",
+    "Question": ".questions",
+    "Answer": ".questions",
+    "WhylineCLI": ".cli",
+}
 
 __version__ = "0.1.0"
 __all__ = [
@@ -29,15 +37,36 @@ __all__ = [
     "start_tracing",
     "stop_tracing",
     "instrument_code",
+    "instrument_ast",
     "instrument_file",
+    "instrument_files",
     "exec_instrumented",
     "QuestionAsker",
     "Question",
     "Answer",
     "WhylineCLI",
+    "WhylineUI",
     "UI_AVAILABLE"
 ]
 
-# Only export WhylineUI if available
-if UI_AVAILABLE:
-    __all__.append("WhylineUI")
\ No newline at end of file
+
+def _load_ui():
+    """Import the Tkinter UI if available, caching the result on the package"""
+    try:
+        from .ui import WhylineUI
+        ui_available = True
+    except ImportError:
+        WhylineUI = None
+        ui_available = False
+    globals().update(WhylineUI=WhylineUI, UI_AVAILABLE=ui_available)
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+        globals()[name] = value
+        return value
+    if name in ("WhylineUI", "UI_AVAILABLE"):
+        _load_ui()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -3,6 +3,7 @@ Command-line interface for Python Whyline.
 Alternative to the GUI that works without tkinter.
 """
 
+import ast
 import os
 import sys
 import cmd
@@ -11,22 +12,28 @@ from typing import Optional, List
 
 # Handle both relative and absolute imports
 try:
-    from .tracer import get_tracer, TraceEvent
+    from .events import TraceEvent
+    from .tracer import get_tracer
     from .instrumenter import instrument_code, exec_instrumented
     from .questions import QuestionAsker, Question, Answer
 except ImportError:
     # If relative imports fail, try absolute imports
     try:
-        from python_whyline.tracer import get_tracer, TraceEvent
+        from python_whyline.events import TraceEvent
+        from python_whyline.tracer import get_tracer
         from python_whyline.instrumenter import instrument_code, exec_instrumented
         from python_whyline.questions import QuestionAsker, Question, Answer
     except ImportError:
         # If that fails too, add the parent directory to the path
         sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        from python_whyline.tracer import get_tracer, TraceEvent
+        from python_whyline.events import TraceEvent
+        from python_whyline.tracer import get_tracer
         from python_whyline.instrumenter import instrument_code, exec_instrumented
         from python_whyline.questions import QuestionAsker, Question, Answer
 
+# Errors ast.literal_eval raises for input that is not a usable literal;
+# e.g. "{[1]: 2}" parses but raises TypeError for the unhashable key
+_LITERAL_EVAL_ERRORS = (ValueError, TypeError, SyntaxError, MemoryError, RecursionError)
 
 class WhylineCLI(cmd.Cmd):
     """Interactive command-line interface for Python Whyline"""
@@ -42,6 +49,7 @@ Commands:
   ask                 - Ask questions about execution
   trace               - Show trace statistics
   events              - Show recent trace events
+  compress on|off     - Collapse linear chains in answer evidence
   clear               - Clear current trace
   help                - Show this help
   quit                - Exit
@@ -58,6 +66,22 @@ Type 'help <command>' for detailed help on a command.
         self.current_code = ""
         self.current_filename = "<interactive>"
         self.questions: List[Question] = []
+        # Whether answers show evidence with linear event chains collapsed
+        self.compress_evidence = False
+        self._code_lines: Optional[List[str]] = None  # Cached split of current_code
+        # Command name -> bound do_* handler, resolved once instead of per line
+        self._dispatch = {name[3:]: getattr(self, name)
+                          for name in dir(self) if name.startswith('do_')}
+    
+    def onecmd(self, line: str):
+        """Dispatch known commands through the precomputed handler table"""
+        command, arg, line = self.parseline(line)
+        handler = self._dispatch.get(command) if command else None
+        if handler is None:
+            # Empty lines, help shortcuts and unknown commands keep cmd.Cmd behavior
+            return super().onecmd(line)
+        self.lastcmd = '' if line == 'EOF' else line
+        return handler(arg)
     
     def do_load(self, filename: str):
         """Load a Python file: load <filename>"""
@@ -68,6 +92,7 @@ Type 'help <command>' for detailed help on a command.
         try:
             with open(filename, 'r') as f:
                 self.current_code = f.read()
+            self._code_lines = self.current_code.splitlines()
             self.current_filename = filename
             print(f"Loaded {filename}")
             print("Code:")
@@ -96,6 +121,7 @@ Type 'help <command>' for detailed help on a command.
                 break
         
         self.current_code = '\n'.join(code_lines)
+        self._code_lines = code_lines
         self.current_filename = "<interactive>"
         print("Code entered:")
         print("-" * 40)
@@ -111,14 +137,8 @@ Type 'help <command>' for detailed help on a command.
         self.tracer.clear()
         
         try:
-            # Handle files with __name__ == "__main__" blocks
-            code_to_run = self.current_code
-            if 'if __name__ == "__main__":' in code_to_run:
-                # Replace the condition to make it always true
-                code_to_run = code_to_run.replace('if __name__ == "__main__":', 'if True:')
-                print("(Modified __name__ check to run main code)")
-            
-            exec_instrumented(code_to_run)
+            # exec_instrumented makes __name__ == "__main__" blocks run
+            exec_instrumented(self.current_code)
             stats = self.tracer.get_stats()
             print(f"Execution completed. {stats['total_events']} events recorded.")
             
@@ -177,10 +197,10 @@ Type 'help <command>' for detailed help on a command.
             print("Value required")
             return
         
-        # Try to evaluate the value
+        # Try to parse the value as a Python literal
         try:
-            value = eval(value_str)
-        except:
+            value = ast.literal_eval(value_str)
+        except _LITERAL_EVAL_ERRORS:
             value = value_str
         
         line_no_str = input("Line number (optional): ").strip()
@@ -235,10 +255,10 @@ Type 'help <command>' for detailed help on a command.
             print("Return value required")
             return
         
-        # Try to evaluate the value
+        # Try to parse the value as a Python literal
         try:
-            value = eval(value_str)
-        except:
+            value = ast.literal_eval(value_str)
+        except _LITERAL_EVAL_ERRORS:
             value = value_str
         
         question = self.asker.why_did_function_return(func_name, value)
@@ -246,7 +266,10 @@ Type 'help <command>' for detailed help on a command.
     
     def _process_question(self, question: Question):
         """Process a question and show the answer"""
-        self.questions.append(question)
+        # The asker hands back the same question when it is asked again on an
+        # unchanged trace; keep one history entry for it
+        if question not in self.questions:
+            self.questions.append(question)
         
         print(f"\nQuestion: {question}")
         print("Computing answer...")
@@ -255,15 +278,20 @@ Type 'help <command>' for detailed help on a command.
             answer = question.get_answer()
             print(f"\nAnswer: {answer}")
             
-            if answer.evidence:
-                print(f"\nEvidence ({len(answer.evidence)} events):")
-                for i, event in enumerate(answer.evidence[:5]):  # Show first 5
+            answer.compress = self.compress_evidence
+            evidence = answer.display_evidence()
+            if evidence:
+                if len(evidence) < len(answer.evidence):
+                    print(f"\nEvidence ({len(evidence)} of {len(answer.evidence)} events after compressing chains):")
+                else:
+                    print(f"\nEvidence ({len(evidence)} events):")
+                for i, event in enumerate(evidence[:5]):  # Show first 5
                     print(f"  {i+1}. Line {event.lineno}: {event.event_type}")
                     if event.data:
                         print(f"      Data: {event.data}")
                 
-                if len(answer.evidence) > 5:
-                    print(f"  ... and {len(answer.evidence) - 5} more events")
+                if len(evidence) > 5:
+                    print(f"  ... and {len(evidence) - 5} more events")
         except Exception as e:
             print(f"Error computing answer: {e}")
     
@@ -315,18 +343,32 @@ Type 'help <command>' for detailed help on a command.
             except ValueError:
                 print("Invalid count, using default (10)")
         
-        print(f"Recent {count} trace events:")
-        events = self.tracer.events[-count:]
+        events = self.tracer.events.recent(count)
         
+        # Build the whole listing first and write it once instead of printing per event
+        lines = [f"Recent {count} trace events:"]
         for event in events:
-            print(f"  {event.event_id}: Line {event.lineno} - {event.event_type}")
+            lines.append(f"  {event.event_id}: Line {event.lineno} - {event.event_type}")
             if event.data:
-                print(f"    Data: {event.data}")
+                lines.append(f"    Data: {event.data}")
+        lines.append("")
+        sys.stdout.write("\n".join(lines))
+    
+    def do_compress(self, line: str):
+        """Collapse linear event chains in answer evidence: compress on|off"""
+        setting = line.strip().lower()
+        if setting in ('on', 'off'):
+            self.compress_evidence = setting == 'on'
+        elif setting:
+            print("Usage: compress on|off")
+            return
+        print(f"Evidence compression is {'on' if self.compress_evidence else 'off'}")
     
     def do_clear(self, line: str):
         """Clear current trace"""
         self.tracer.clear()
         self.questions.clear()
+        self._code_lines = None
         print("Trace cleared")
     
     def do_quit(self, line: str):
@@ -349,9 +391,9 @@ Type 'help <command>' for detailed help on a command.
             print("No code loaded")
             return
         
-        lines = self.current_code.split('\n')
-        for i, line in enumerate(lines, 1):
-            print(f"{i:3d}: {line}")
+        if self._code_lines is None:
+            self._code_lines = self.current_code.splitlines()
+        sys.stdout.write(''.join(f"{i:3d}: {line}\n" for i, line in enumerate(self._code_lines, 1)))
     
     def emptyline(self):
         """Do nothing on empty line"""
@@ -2,13 +2,15 @@
 Shared event type definitions and data structures for Python Whyline tracing system.
 """
 
-import json
-import pickle
-import time
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain
+import sys
 import threading
+from time import perf_counter_ns as _now
 from enum import StrEnum
 from dataclasses import dataclass, field
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Sequence, Union
 
 
 class EventType(StrEnum):
@@ -25,12 +27,48 @@ class EventType(StrEnum):
     # IMPORT = "import"
 
 
-@dataclass
+# Cached value -> member lookup, avoiding EnumMeta.__call__ per event
+EVENT_TYPES_BY_VALUE = {event_type.value: event_type for event_type in EventType}
+
+
+# Reference point for event timestamps, in perf_counter nanoseconds.
+# Reset by the tracer whenever a new trace starts.
+_TRACE_EPOCH = _now()
+
+
+def reset_trace_epoch() -> None:
+    """Start measuring event timestamps from now"""
+    global _TRACE_EPOCH
+    _TRACE_EPOCH = _now()
+
+
+# Per-thread cache of threading.get_ident(), filled on first use in each thread
+_THREAD_LOCAL = threading.local()
+
+
+def _current_thread_id() -> int:
+    """Get the current thread's identifier, cached per thread"""
+    try:
+        return _THREAD_LOCAL.ident
+    except AttributeError:
+        _THREAD_LOCAL.ident = threading.get_ident()
+        return _THREAD_LOCAL.ident
+
+
+# Types whose values are always picklable and can skip the pickle probe
+_SAFE_TYPES = (int, float, str, bool, type(None), bytes)
+_SAFE_CONTAINERS = (list, tuple, dict)
+
+
+@dataclass(slots=True)
 class TraceEvent:
     """Unified trace event that serves both runtime execution and static instrumentation needs.
     
     This class combines the functionality of the previous separate TraceEvent classes
     from tracer.py and instrumenter.py into a single, coherent data structure.
+    
+    Declared with slots so instances carry no per-event ``__dict__``; traces hold
+    many events, so do not attach ad-hoc attributes to them.
     """
     event_id: int
     filename: str
@@ -41,31 +79,60 @@ class TraceEvent:
     data: Dict[str, Any] = field(default_factory=dict)
     
     # Runtime execution context (optional - populated during actual execution)
-    timestamp: Optional[float] = None
+    timestamp: Optional[int] = None  # Nanoseconds since the trace epoch
     thread_id: Optional[int] = None
+    # id() of the recording frame; only meaningful while tracing, so not serialized
+    frame_id: Optional[int] = field(default=None, repr=False, compare=False)
     locals_snapshot: Dict[str, Any] = field(default_factory=dict)
     globals_snapshot: Dict[str, Any] = field(default_factory=dict)
     
+    # Whether the snapshots have already been sanitized for serialization
+    _sanitized: bool = field(default=False, init=False, repr=False, compare=False)
+    
     def __post_init__(self):
-        """Initialize runtime fields and sanitize snapshots if present"""
-        # Set runtime fields if not provided
+        """Initialize runtime fields if not provided"""
+        # Filenames repeat across nearly every event; share one string object
+        self.filename = sys.intern(self.filename)
         if self.timestamp is None:
-            self.timestamp = time.time()
+            self.timestamp = _now() - _TRACE_EPOCH
         if self.thread_id is None:
-            self.thread_id = threading.get_ident()
-            
-        # Sanitize snapshots to avoid circular references and unpicklable objects
+            self.thread_id = _current_thread_id()
+    
+    def sanitize(self) -> None:
+        """Sanitize snapshots in place, once, before serialization.
+        
+        Snapshots are stored raw while tracing so the hot path does not pay for
+        sanitization; only events that actually get serialized are cleaned.
+        """
+        if self._sanitized:
+            return
         if self.locals_snapshot:
             self.locals_snapshot = self._sanitize_dict(self.locals_snapshot)
         if self.globals_snapshot:
             self.globals_snapshot = self._sanitize_dict(self.globals_snapshot)
+        self._sanitized = True
+    
+    def sanitized_locals(self) -> Dict[str, Any]:
+        """Get the locals snapshot with unpicklable and internal values removed"""
+        self.sanitize()
+        return self.locals_snapshot
+    
+    def sanitized_globals(self) -> Dict[str, Any]:
+        """Get the globals snapshot with unpicklable and internal values removed"""
+        self.sanitize()
+        return self.globals_snapshot
     
     def _sanitize_dict(self, d: Dict[str, Any]) -> Dict[str, Any]:
         """Remove unpicklable objects and internal variables from snapshots"""
+        import pickle  # Deferred: only needed when serializing
+        
         sanitized = {}
         for k, v in d.items():
             if k.startswith('_whyline_'):
                 continue
+            if self._is_safe_value(v):
+                sanitized[k] = v
+                continue
             try:
                 # Test if it's serializable
                 pickle.dumps(v)
@@ -74,22 +141,41 @@ class TraceEvent:
                 sanitized[k] = f"<unpicklable: {type(v).__name__}>"
         return sanitized
     
+    @staticmethod
+    def _is_safe_value(v: Any) -> bool:
+        """Check whether a value is known to be picklable without probing it.
+        
+        Primitives are accepted directly; lists, tuples and dicts are accepted
+        when their elements (one level deep) are primitives.
+        """
+        value_type = type(v)
+        if value_type in _SAFE_TYPES:
+            return True
+        if value_type is dict:
+            return all(type(key) in _SAFE_TYPES and type(item) in _SAFE_TYPES
+                       for key, item in v.items())
+        if value_type in _SAFE_CONTAINERS:
+            return all(type(item) in _SAFE_TYPES for item in v)
+        return False
+    
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary representation for serialization"""
         return {
             'event_id': self.event_id,
             'filename': self.filename,
             'lineno': self.lineno,  # Standardized field name
-            'event_type': str(self.event_type),  # Convert enum to string
+            'event_type': self.event_type.value,  # StrEnum value is already a str
             'data': self.data,
             'timestamp': self.timestamp,
             'thread_id': self.thread_id,
-            'locals_snapshot': self.locals_snapshot,
-            'globals_snapshot': self.globals_snapshot
+            'locals_snapshot': self.sanitized_locals(),
+            'globals_snapshot': self.sanitized_globals()
         }
     
     def to_json(self) -> str:
         """Convert to JSON string representation"""
+        import json  # Deferred: only needed when serializing
+        
         return json.dumps(self.to_dict(), indent=2, default=str)
     
     @classmethod
@@ -98,9 +184,9 @@ class TraceEvent:
         # Convert string event_type back to enum if needed
         event_type = data.get('event_type')
         if isinstance(event_type, str):
-            event_type = EventType(event_type)
+            event_type = EVENT_TYPES_BY_VALUE.get(event_type) or EventType(event_type)
             
-        return cls(
+        event = cls(
             event_id=data['event_id'],
             filename=data['filename'],
             lineno=data['lineno'],
@@ -111,6 +197,9 @@ class TraceEvent:
             locals_snapshot=data.get('locals_snapshot', {}),
             globals_snapshot=data.get('globals_snapshot', {})
         )
+        # Persisted snapshots were sanitized when they were serialized
+        event._sanitized = True
+        return event
     
     
     # Convenience methods for common data patterns
@@ -136,4 +225,184 @@ class TraceEvent:
     
     def get_deps(self) -> list:
         """Get list of variable dependencies for this event"""
-        return self.data.get('deps', [])
\ No newline at end of file
+        return self.data.get('deps', [])
+
+
+# Compact integer codes for event types, used by the columnar EventStore
+EVENT_TYPES = tuple(EventType)
+EVENT_TYPE_CODES = {event_type: code for code, event_type in enumerate(EVENT_TYPES)}
+
+
+class EventStore:
+    """Columnar storage for recorded trace events.
+    
+    Events are kept in insertion order as ``TraceEvent`` objects so existing
+    consumers can index, slice and iterate the store like a list. Alongside them
+    the fields that queries scan most (line number, event type, filename,
+    timestamp) are stored as parallel typed arrays, so linear scans touch
+    compact columns instead of dereferencing every event object.
+    
+    Timestamps are usually in trace order, but nothing guarantees it: events
+    from concurrent threads are stamped before they are queued, and loaded or
+    externally built traces are taken as given. The store tracks whether the
+    timestamp column is sorted and only bisects it when it is.
+    """
+    
+    def __init__(self, events: Iterable[TraceEvent] = ()):
+        self._events: List[TraceEvent] = []
+        self.lineno = array('l')
+        self.event_type = array('B')  # Codes into EVENT_TYPES
+        self.filename_id = array('l')  # Indices into self.filenames
+        self.timestamp = array('q')
+        self.filenames: List[str] = []
+        self._filename_ids: Dict[str, int] = {}
+        # Inverted index: assigned variable name -> indices of its events
+        self._var_index: Dict[str, List[int]] = {}
+        # Inverted index: function name (calls, entries) -> indices of its events
+        self._func_index: Dict[str, List[int]] = {}
+        # Event type code -> indices of its events, so type filters skip other events
+        self._type_index: Dict[int, List[int]] = {}
+        # Whether the timestamp column is non-decreasing, so time windows can bisect it
+        self._timestamps_sorted = True
+        self.extend(events)
+    
+    def _get_filename_id(self, filename: str) -> int:
+        """Get or assign the intern table index for a filename"""
+        filename_id = self._filename_ids.get(filename)
+        if filename_id is None:
+            filename_id = len(self.filenames)
+            self._filename_ids[filename] = filename_id
+            self.filenames.append(filename)
+        return filename_id
+    
+    def append(self, event: TraceEvent) -> None:
+        """Append an event and its column values"""
+        var_name = event.data.get('var_name')
+        if var_name is not None:
+            self._var_index.setdefault(var_name, []).append(len(self._events))
+        func_name = event.data.get('func_name')
+        if func_name is not None:
+            self._func_index.setdefault(func_name, []).append(len(self._events))
+        code = EVENT_TYPE_CODES[event.event_type]
+        self._type_index.setdefault(code, []).append(len(self._events))
+        self._events.append(event)
+        self.lineno.append(event.lineno)
+        self.event_type.append(code)
+        self.filename_id.append(self._get_filename_id(event.filename))
+        if self.timestamp and event.timestamp < self.timestamp[-1]:
+            self._timestamps_sorted = False
+        self.timestamp.append(event.timestamp)
+    
+    def extend(self, events: Iterable[TraceEvent]) -> None:
+        """Append several events, filling each column in one pass"""
+        events = list(events)
+        if not events:
+            return
+        start = len(self._events)
+        codes = [EVENT_TYPE_CODES[event.event_type] for event in events]
+        for index, event, code in zip(range(start, start + len(events)), events, codes):
+            var_name = event.data.get('var_name')
+            if var_name is not None:
+                self._var_index.setdefault(var_name, []).append(index)
+            func_name = event.data.get('func_name')
+            if func_name is not None:
+                self._func_index.setdefault(func_name, []).append(index)
+            self._type_index.setdefault(code, []).append(index)
+        self._events.extend(events)
+        self.lineno.extend([event.lineno for event in events])
+        self.event_type.extend(codes)
+        self.filename_id.extend([self._get_filename_id(event.filename) for event in events])
+        timestamps = [event.timestamp for event in events]
+        if self._timestamps_sorted:
+            previous = self.timestamp[-1] if self.timestamp else timestamps[0]
+            for timestamp in timestamps:
+                if timestamp < previous:
+                    self._timestamps_sorted = False
+                    break
+                previous = timestamp
+        self.timestamp.extend(timestamps)
+    
+    def clear(self) -> None:
+        """Remove all events and reset the columns"""
+        self._events.clear()
+        for column in (self.lineno, self.event_type, self.filename_id, self.timestamp):
+            del column[:]
+        self.filenames.clear()
+        self._filename_ids.clear()
+        self._var_index.clear()
+        self._func_index.clear()
+        self._type_index.clear()
+        self._timestamps_sorted = True
+    
+    def copy(self) -> List[TraceEvent]:
+        """Return the events as a plain list"""
+        return self._events.copy()
+    
+    def recent(self, count: int) -> List[TraceEvent]:
+        """Get the last ``count`` events in O(count), without touching the rest"""
+        if count <= 0:
+            return []
+        return self._events[-count:]
+    
+    def find_filename_id(self, filename: str) -> Optional[int]:
+        """Get the intern table index for a filename, or None if never recorded"""
+        return self._filename_ids.get(filename)
+    
+    def indices_for_var(self, var_name: str) -> List[int]:
+        """Get indices, in trace order, of events whose data names this variable"""
+        return self._var_index.get(var_name, [])
+    
+    def indices_for_func(self, func_name: str) -> List[int]:
+        """Get indices, in trace order, of events whose data names this function"""
+        return self._func_index.get(func_name, [])
+    
+    def indices_after(self, timestamp: int, indices: Sequence[int] = None) -> Sequence[int]:
+        """Get indices, in trace order, of events recorded after a timestamp.
+        
+        ``indices`` restricts the result to a trace-ordered subset, such as one
+        of the index lists. While the timestamp column is sorted the window
+        start is found by bisection; otherwise the column is scanned.
+        """
+        if indices is None:
+            indices = range(len(self._events))
+        if self._timestamps_sorted:
+            return indices[bisect_left(indices, bisect_right(self.timestamp, timestamp)):]
+        timestamps = self.timestamp
+        return [i for i in indices if timestamps[i] > timestamp]
+    
+    def indices_where(self, event_types: Iterable[EventType] = None,
+                      filename: str = None) -> List[int]:
+        """Get indices, in trace order, of events matching the given types and filename"""
+        if event_types is None:
+            matching = range(len(self._events))
+        else:
+            # Start from the type index, touching only events of the requested types
+            per_type = [self._type_index.get(code, [])
+                        for code in {EVENT_TYPE_CODES[event_type] for event_type in event_types}]
+            matching = per_type[0] if len(per_type) == 1 else sorted(chain.from_iterable(per_type))
+        if filename is not None:
+            filename_id = self.find_filename_id(filename)
+            if filename_id is None:
+                return []
+            column = self.filename_id
+            return [i for i in matching if column[i] == filename_id]
+        return list(matching)
+    
+    def count_by_type(self) -> Dict[EventType, int]:
+        """Count events per event type"""
+        counts = [0] * len(EVENT_TYPES)
+        for code in self.event_type:
+            counts[code] += 1
+        return {EVENT_TYPES[code]: count for code, count in enumerate(counts) if count}
+    
+    def __len__(self) -> int:
+        return len(self._events)
+    
+    def __iter__(self) -> Iterator[TraceEvent]:
+        return iter(self._events)
+    
+    def __getitem__(self, index: Union[int, slice]) -> Union[TraceEvent, List[TraceEvent]]:
+        return self._events[index]
+    
+    def __repr__(self) -> str:
+        return f"EventStore({len(self._events)} events)"
@@ -2,16 +2,20 @@
 Fixed AST-based source code instrumenter for Python Whyline.
 This version properly handles AST contexts and node transformation.
 """
-from .events import EventType, TraceEvent
+from .events import EventType
 import ast
+import marshal
+import os
 import sys
-from typing import Dict, Any, List
-from dataclasses import dataclass, field
-import copy
-from .tracer import get_tracer
+from array import array
+from types import CodeType
+from typing import Dict, Any, List, Optional, Tuple, Union
+from dataclasses import dataclass
+from functools import lru_cache
+from .tracer import RECORD_EVENT_ALIAS, get_tracer
 import builtins
 
-@dataclass
+@dataclass(slots=True)
 class InstrumentationInfo:
     """Static metadata about where instrumentation code was inserted during AST transformation.
     
@@ -23,194 +27,411 @@ class InstrumentationInfo:
     col_offset: int
     filename: str
     event_type: str
-    description: str = ""
 
 
-class VariableCollector(ast.NodeVisitor):
-    """Collect variable names read in an expression"""
+def _get_base_name(node):
+    """Get the base name from a potentially nested expression."""
+    if isinstance(node, ast.Name):
+        return node.id
+    elif isinstance(node, ast.Attribute):
+        # For chained attributes, get the leftmost base name
+        return _get_base_name(node.value)
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        # For method calls, get the base name of the method being called
+        return _get_base_name(node.func.value)
+    return None
+
+
+# Shared expression context for cloned nodes; contexts carry no state
+_LOAD = ast.Load()
+_CONTEXT_TYPES = frozenset({ast.Load, ast.Store, ast.Del})
+# Nodes whose 'target' binds a name even inside a read expression
+_BINDING_TARGET_OWNERS = frozenset({ast.comprehension, ast.NamedExpr})
+
+
+def _clone_as_load(node, as_load: bool = True):
+    """Clone an expression subtree for use in a tracer call, with its contexts set to Load.
     
-    def __init__(self):
-        self.variables = set()
+    A single pass replaces copy.deepcopy plus a context-fixing traversal: ASTs are
+    trees, so no memo dict is needed, and immutable constants are shared, not copied.
+    Comprehension and walrus targets keep their Store context so the clone still
+    compiles.
+    """
+    node_type = type(node)
+    if node_type is list:
+        return [_clone_as_load(item, as_load) for item in node]
+    if node_type is ast.Constant or not isinstance(node, ast.AST):
+        return node
+    if node_type is ast.Name:
+        # The most common leaf to clone: build it directly
+        return ast.Name(id=node.id, ctx=_LOAD if as_load else node.ctx,
+                        lineno=node.lineno, col_offset=node.col_offset,
+                        end_lineno=node.end_lineno, end_col_offset=node.end_col_offset)
+    if node_type in _CONTEXT_TYPES:
+        return _LOAD if as_load else node
+    clone = node_type.__new__(node_type)
+    if node_type in _BINDING_TARGET_OWNERS:
+        clone.__dict__.update({name: _clone_as_load(value, as_load and name != 'target')
+                               for name, value in node.__dict__.items()})
+    else:
+        clone.__dict__.update({name: _clone_as_load(value, as_load)
+                               for name, value in node.__dict__.items()})
+    return clone
+
+
+def _fill_locations(node: ast.AST, source: ast.AST) -> ast.AST:
+    """Give every node in a generated subtree that lacks a position the position of source.
     
-    def visit_Name(self, node):
-        if isinstance(node.ctx, ast.Load):
-            self.variables.add(node.id)
-        self.generic_visit(node)
+    Generated nodes are located as they are built, so compiling the instrumented
+    tree needs no ast.fix_missing_locations walk over the whole module.
     
-    def visit_Attribute(self, node):
-        # For obj.attr, we want to track 'obj' as a read variable
-        self.visit(node.value)
-        
-        # Track attribute access for method calls
-        self._add_attribute_access(node)
-    
-    def _add_attribute_access(self, node):
-        """Add attribute access to variables, handling both simple and chained cases."""
-        # Try to get the base object name by traversing the node tree
-        base_name = self._get_base_name(node.value)
-        if base_name:
-            full_attr = f"{base_name}.{node.attr}"
-            self.variables.add(full_attr)
-    
-    def _get_base_name(self, node):
-        """Get the base name from a potentially nested expression."""
-        if isinstance(node, ast.Name):
-            return node.id
-        elif isinstance(node, ast.Attribute):
-            # For chained attributes, get the leftmost base name
-            return self._get_base_name(node.value)
-        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
-            # For method calls, get the base name of the method being called
-            return self._get_base_name(node.func.value)
-        return None
-    
-    def visit_Subscript(self, node):
-        # For arr[index], we want to track both 'arr' and 'index' variables
-        self.visit(node.value)
-        self.visit(node.slice)
-    
-    @classmethod
-    def get_read_variables(cls, node: ast.AST) -> list:
-        """Get list of variables read in an expression"""
-        collector = cls()
-        collector.visit(node)
-        return sorted(list(collector.variables))
-
-
-class ContextFixer(ast.NodeTransformer):
-    """Fix AST contexts to ensure proper Load/Store usage"""
-    
-    def visit_Name(self, node):
-        # When we copy nodes for tracing, we need to ensure they have Load context
-        if hasattr(node, 'ctx') and isinstance(node.ctx, ast.Store):
-            # Create a new node with Load context for expressions
-            new_node = ast.Name(id=node.id, ctx=ast.Load())
-            return ast.copy_location(new_node, node)
-        return node
+    Unlocated nodes of the shared template types are never stamped: they may be
+    reused by any number of tracer calls (see _TRACER_FUNC), so each one is
+    replaced by a located copy instead.
+    """
+    location = {
+        'lineno': source.lineno,
+        'col_offset': source.col_offset,
+        'end_lineno': source.end_lineno,
+        'end_col_offset': source.end_col_offset,
+    }
     
-    def visit_Attribute(self, node):
-        # Same for attributes
-        self.generic_visit(node)
-        if hasattr(node, 'ctx') and isinstance(node.ctx, ast.Store):
-            new_node = ast.Attribute(
-                value=node.value,
-                attr=node.attr,
-                ctx=ast.Load()
-            )
-            return ast.copy_location(new_node, node)
-        return node
+    def located(child):
+        if type(child) in _SHARED_TEMPLATE_TYPES and not hasattr(child, 'lineno'):
+            copy = type(child).__new__(type(child))
+            copy.__dict__.update(child.__dict__)
+            copy.__dict__.update(location)
+            return copy
+        return child
     
-    def visit_Subscript(self, node):
-        # Same for subscripts
-        self.generic_visit(node)
-        if hasattr(node, 'ctx') and isinstance(node.ctx, ast.Store):
-            new_node = ast.Subscript(
-                value=node.value,
-                slice=node.slice,
-                ctx=ast.Load()
-            )
-            return ast.copy_location(new_node, node)
-        return node
+    node = located(node)
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if 'lineno' in current._attributes:
+            if not hasattr(current, 'lineno'):
+                current.lineno = location['lineno']
+                current.col_offset = location['col_offset']
+            if current.end_lineno is None:
+                current.end_lineno = location['end_lineno']
+                current.end_col_offset = location['end_col_offset']
+        for name, value in ast.iter_fields(current):
+            if isinstance(value, ast.AST):
+                value = located(value)
+                setattr(current, name, value)
+                stack.append(value)
+            elif type(value) is list and value:
+                for index, item in enumerate(value):
+                    if isinstance(item, ast.AST):
+                        item = value[index] = located(item)
+                        stack.append(item)
+    return node
+
+
+def _tracer_stmt(call: ast.Call) -> ast.Expr:
+    """Wrap a tracer call in an expression statement at the call's position"""
+    return ast.Expr(value=call, lineno=call.lineno, col_offset=call.col_offset,
+                    end_lineno=call.end_lineno, end_col_offset=call.end_col_offset)
+
+
+def _batch_tracer_stmt(tracer_stmts: List[ast.Expr]) -> ast.Expr:
+    """Fuse adjacent tracer statements into one record_events call taking each call's args"""
+    first_call = tracer_stmts[0].value
+    call = ast.Call(
+        func=_BATCH_TRACER_FUNC,
+        args=[ast.Tuple(elts=stmt.value.args, ctx=_LOAD) for stmt in tracer_stmts],
+        keywords=_NO_KEYWORDS
+    )
+    return _tracer_stmt(_fill_locations(call, first_call))
+
+
+# Nodes the instrumenter never rewrites and that contain no statements, so
+# generic_visit does not descend into them
+_LEAF_TYPES = frozenset({
+    ast.Constant, ast.Load, ast.Store, ast.Del, ast.Pass, ast.Break, ast.Continue,
+    ast.arguments, ast.arg,
+    *ast.operator.__subclasses__(), *ast.unaryop.__subclasses__(),
+    *ast.boolop.__subclasses__(), *ast.cmpop.__subclasses__(),
+})
+
+
+# Statements inserted at the top of every instrumented module
+_PRELUDE = ast.parse(
+    "from pywhy.tracer import get_tracer\n"
+    "_whyline_tracer = get_tracer()\n"
+    f"{RECORD_EVENT_ALIAS} = _whyline_tracer.record_event\n"
+).body
+
+
+# Argument keys and fixed values that appear in every generated tracer call
+_TRACER_ARG_CONSTANTS = (
+    'args', 'assign_type', 'attribute', 'aug', 'condition', 'container', 'decision',
+    'deps', 'elif_block', 'else_block', 'func_name', 'if_block', 'index', 'iter_value',
+    'lower', 'obj', 'obj_attr', 'result', 'simple', 'skip_block', 'slice',
+    'slice_type', 'step', 'target', 'target_type', 'upper', 'value', 'var_name',
+    'variable', None,
+)
+
+# One shared Constant node per value, reused by every tracer call in every
+# module. They stay unlocated; _fill_locations gives each use a located copy.
+_ARG_CONSTANTS = {value: ast.Constant(value=value) for value in _TRACER_ARG_CONSTANTS}
+_EVENT_TYPE_CONSTANTS = {event_type: ast.Constant(value=event_type.value) for event_type in EventType}
+
+# Callee of every tracer call: the record_event alias, a global bound by the
+# prelude and rebound as a local in every function. _TRACER_FUNC is the bound
+# method the aliases are taken from. These stay unlocated; each use gets a
+# located copy.
+_TRACER_FUNC = ast.Attribute(
+    value=ast.Name(id='_whyline_tracer', ctx=ast.Load()),
+    attr='record_event',
+    ctx=ast.Load()
+)
+_LOCAL_TRACER_FUNC = ast.Name(id=RECORD_EVENT_ALIAS, ctx=ast.Load())
+# Callee of a fused call recording several adjacent events
+_BATCH_TRACER_FUNC = ast.Attribute(
+    value=ast.Name(id='_whyline_tracer', ctx=ast.Load()),
+    attr='record_events',
+    ctx=ast.Load()
+)
+# Tracer calls never pass keywords; all of them share this list, which must stay empty
+_NO_KEYWORDS: List[ast.keyword] = []
+
+# Generated node types that may be shared between tracer calls while unlocated
+# (the argument constants, the callees); _fill_locations gives each use a located copy
+_SHARED_TEMPLATE_TYPES = frozenset({ast.Constant, ast.Name, ast.Attribute})
+
+
+def _is_main_guard(test: ast.expr) -> bool:
+    """Whether an if-test is `__name__ == "__main__"`, in either operand order"""
+    if not (type(test) is ast.Compare and len(test.ops) == 1 and type(test.ops[0]) is ast.Eq):
+        return False
+    left, right = test.left, test.comparators[0]
+    if type(left) is ast.Constant:
+        left, right = right, left
+    return (type(left) is ast.Name and left.id == '__name__'
+            and type(right) is ast.Constant and right.value == '__main__')
+
+
+def _is_pure_constant(node: ast.expr) -> bool:
+    """Whether an expression is a literal built only from constants, like 0 or (1, 'a')"""
+    node_type = type(node)
+    if node_type is ast.Constant:
+        return True
+    if node_type in (ast.Tuple, ast.List, ast.Set):
+        return all(map(_is_pure_constant, node.elts))
+    if node_type is ast.Dict:
+        # A None key is a **mapping unpack, whose value is not a literal
+        return (None not in node.keys and all(map(_is_pure_constant, node.keys))
+                and all(map(_is_pure_constant, node.values)))
+    return False
+
+
+def _unpacked_names(target: ast.expr) -> List[str]:
+    """Names bound by a tuple or list target, in order, including nested and starred ones"""
+    names = []
+    for elt in target.elts:
+        if type(elt) is ast.Starred:
+            elt = elt.value
+        if type(elt) is ast.Name:
+            names.append(elt.id)
+        elif type(elt) in (ast.Tuple, ast.List):
+            names.extend(_unpacked_names(elt))
+    return names
 
 
 class WhylineInstrumenter(ast.NodeTransformer):
     """Fixed AST transformer that properly handles contexts"""
     
-    def __init__(self, filename: str):
-        self.filename = filename
+    def __init__(self, filename: str, run_main_guards: bool = False, skip_trivial: bool = False,
+                 standalone: bool = True):
+        self.filename = sys.intern(filename)
+        # Emit the tracer import prelude; without it the executor must seed the
+        # tracer globals (see exec_instrumented)
+        self.standalone = standalone
+        # Rewrite `if __name__ == "__main__":` tests to True, for code exec'd as a script
+        self.run_main_guards = run_main_guards
+        # Leave `name = <literal of constants>` untraced: such events have no
+        # dependencies to explain
+        self.skip_trivial = skip_trivial
+        self.main_guards_rewritten = 0
         self.event_id = 0
-        self.instrumentation_points: List[InstrumentationInfo] = []
-        self.context_fixer = ContextFixer()
+        # Instrumentation points as parallel columns; the filename is shared by all
+        self._point_event_ids = array('l')
+        self._point_linenos = array('l')
+        self._point_col_offsets = array('l')
+        self._point_event_types: List[EventType] = []
+        # Invariant nodes shared by all of this module's tracer calls
+        self._filename_constant = ast.Constant(value=self.filename)
+        # One Constant per variable name, shared by every deps list and var_name
+        self._name_constants: Dict[str, ast.Constant] = {}
+        # id(node) -> (node, variables read in it)
+        self._read_variables_cache: Dict[int, tuple] = {}
+        # Assignment target builders keyed by exact node type; targets of any
+        # other type (tuples, starred) are left untraced
+        self._assign_builders = {
+            ast.Name: self._build_name_assign,
+            ast.Attribute: self._build_attr_assign,
+            ast.Subscript: self._build_subscript_assign,
+        }
+        self._aug_assign_builders = {
+            ast.Name: self._build_name_aug_assign,
+            ast.Attribute: self._build_attr_aug_assign,
+            ast.Subscript: self._build_subscript_aug_assign,
+        }
         
     def get_next_event_id(self) -> int:
         """Get next unique event ID"""
         self.event_id += 1
         return self.event_id
     
+    @property
+    def instrumentation_points(self) -> Tuple[InstrumentationInfo, ...]:
+        """Instrumentation points recorded so far, built from the point columns.
+        
+        The result is a fresh read-only view; points are only recorded by the
+        instrumenter itself as it creates tracer calls.
+        """
+        filename = self.filename
+        return tuple(
+            InstrumentationInfo(event_id=event_id, lineno=lineno, col_offset=col_offset,
+                                filename=filename, event_type=event_type)
+            for event_id, lineno, col_offset, event_type in zip(
+                self._point_event_ids, self._point_linenos,
+                self._point_col_offsets, self._point_event_types)
+        )
+    
     def create_tracer_call(self, event_type: EventType, node: ast.AST, 
                           extra_args: List[ast.expr] = None) -> ast.Call:
         """Create a call to the tracer's record_event method"""
         event_id = self.get_next_event_id()
+        # Tracer calls are only created for parsed statements, which always have positions
+        lineno = node.lineno
         
         # Record instrumentation point
-        self.instrumentation_points.append(InstrumentationInfo(
-            event_id=event_id,
-            lineno=getattr(node, 'lineno', 0),
-            col_offset=getattr(node, 'col_offset', 0),
-            filename=self.filename,
-            event_type=event_type
-        ))
+        self._point_event_ids.append(event_id)
+        self._point_linenos.append(lineno)
+        self._point_col_offsets.append(node.col_offset)
+        self._point_event_types.append(event_type)
         
+        # Header and extra arguments are built as one list, without a resize
         args = [
             ast.Constant(value=event_id),
-            ast.Constant(value=self.filename),
-            ast.Constant(value=getattr(node, 'lineno', 0)),
-            ast.Constant(value=event_type.value)  # Convert EventType enum to string
+            self._filename_constant,
+            ast.Constant(value=lineno),
+            _EVENT_TYPE_CONSTANTS[event_type],  # EventType enum as its string value
+            *(extra_args or ())
         ]
         
-        if extra_args:
-            args.extend(extra_args)
-        
         call = ast.Call(
-            func=ast.Attribute(
-                value=ast.Name(id='_whyline_tracer', ctx=ast.Load()),
-                attr='record_event',
-                ctx=ast.Load()
-            ),
+            func=_LOCAL_TRACER_FUNC,
             args=args,
-            keywords=[]
+            keywords=_NO_KEYWORDS,
+            lineno=lineno,
+            col_offset=node.col_offset,
+            end_lineno=node.end_lineno,
+            end_col_offset=node.end_col_offset
         )
         
-        return ast.copy_location(call, node)
+        # The call is located at the statement; fill in the generated arguments
+        return _fill_locations(call, node)
     
     def safe_copy_for_expression(self, node: ast.AST) -> ast.AST:
         """Safely copy a node for use in expressions with proper context"""
-        copied = copy.deepcopy(node)
-        fixed = self.context_fixer.visit(copied)
-        return fixed
+        return _clone_as_load(node)
+    
+    def get_read_variables(self, node: ast.AST) -> frozenset:
+        """Get the variables read in an expression, memoized per node.
+        
+        Dependencies of overlapping subtrees (obj, obj.attr, the assigned value)
+        are requested repeatedly, so each requested node's set is computed once.
+        The subtree is walked with an explicit stack rather than by recursion.
+        """
+        cached = self._read_variables_cache.get(id(node))
+        if cached is not None and cached[0] is node:
+            return cached[1]
+        
+        variables = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            current_type = type(current)
+            if current_type is ast.Name:
+                if type(current.ctx) is ast.Load:
+                    variables.add(current.id)
+            elif current_type is ast.Attribute:
+                # For obj.attr, track 'obj' as a read variable plus the attribute access itself
+                base_name = _get_base_name(current.value)
+                if base_name:
+                    variables.add(f"{base_name}.{current.attr}")
+                stack.append(current.value)
+            elif current_type is ast.Subscript:
+                # For arr[index], track both 'arr' and 'index' variables
+                stack.append(current.value)
+                stack.append(current.slice)
+            elif current_type is not ast.Constant:
+                stack.extend(ast.iter_child_nodes(current))
+        
+        variables = frozenset(variables)
+        # Keep the node alive with its entry so the id cannot be reused
+        self._read_variables_cache[id(node)] = (node, variables)
+        return variables
     
     def add_deps_to_args(self, node: ast.AST, args: List[ast.expr]) -> List[ast.expr]:
         """Add variable dependencies to tracer call arguments"""
-        deps = VariableCollector.get_read_variables(node)
-        
+        return self._finalize_args(args, self.get_read_variables(node))
+    
+    def _name_constant(self, name: str) -> ast.Constant:
+        """Get the shared Constant node for a variable name"""
+        constant = self._name_constants.get(name)
+        if constant is None:
+            constant = self._name_constants[name] = ast.Constant(value=name)
+        return constant
+    
+    def _finalize_args(self, args: List[ast.expr], deps) -> List[ast.expr]:
+        """Append the 'deps' pair to tracer call arguments, if there are any dependencies"""
         if deps:
-            args.extend([
-                ast.Constant(value='deps'),
-                ast.List(elts=[ast.Constant(value=var) for var in deps], ctx=ast.Load())
-            ])
+            name_constant = self._name_constant
+            args += (
+                _ARG_CONSTANTS['deps'],
+                ast.List(elts=[name_constant(var) for var in sorted(deps)], ctx=ast.Load())
+            )
         
         return args
     
 
+    def generic_visit(self, node: ast.AST) -> ast.AST:
+        """Transform a node's children, without visiting leaf nodes"""
+        leaf_types = _LEAF_TYPES
+        for field, old_value in ast.iter_fields(node):
+            if type(old_value) is list:
+                new_values = []
+                for value in old_value:
+                    if isinstance(value, ast.AST) and type(value) not in leaf_types:
+                        value = self.visit(value)
+                        if value is None:
+                            continue
+                        elif not isinstance(value, ast.AST):
+                            new_values.extend(value)
+                            continue
+                    new_values.append(value)
+                old_value[:] = new_values
+            elif isinstance(old_value, ast.AST) and type(old_value) not in leaf_types:
+                new_node = self.visit(old_value)
+                if new_node is None:
+                    delattr(node, field)
+                else:
+                    setattr(node, field, new_node)
+        return node
+    
     # === AST Node Visitors ===
     def visit_Module(self, node: ast.Module) -> ast.Module:
         """Add tracer import to the module"""
         self.generic_visit(node)
         
-        # Add import for the tracer
-        import_stmt = ast.ImportFrom(
-            module='pywhy.tracer',
-            names=[ast.alias(name='get_tracer', asname=None)],
-            level=0,
-            lineno=1,
-            col_offset=0
-        )
-        
-        # Add tracer assignment
-        tracer_assign = ast.Assign(
-            targets=[ast.Name(id='_whyline_tracer', ctx=ast.Store())],
-            value=ast.Call(
-                func=ast.Name(id='get_tracer', ctx=ast.Load()),
-                args=[],
-                keywords=[]
-            ),
-            lineno=1,
-            col_offset=0
-        )
-        
-        # Insert at the beginning
-        node.body.insert(0, tracer_assign)
-        node.body.insert(0, import_stmt)
+        # Insert the tracer import and assignment at the beginning; the prelude
+        # nodes are never mutated, so every module can share them
+        if self.standalone:
+            node.body[0:0] = _PRELUDE
         
         return node
     
@@ -219,251 +440,178 @@ class WhylineInstrumenter(ast.NodeTransformer):
         # First, transform children
         self.generic_visit(node)
         
-        instrumented_stmts = []
-        
-        # Keep the original assignment
-        instrumented_stmts.append(node)
-        
-        # Add tracing for each target
-        for target in node.targets:
-            if isinstance(target, ast.Name):
-                # Simple variable assignment: x = value
-                
-                # Create tracer call arguments
-                args = [
-                    ast.Constant(value='var_name'),
-                    ast.Constant(value=target.id),
-                    ast.Constant(value='value'),
-                    ast.Name(id=target.id, ctx=ast.Load()),  # Fresh node with Load context
-                    ast.Constant(value='target_type'),
-                    ast.Constant(value='variable'),
-                    ast.Constant(value='assign_type'),
-                    ast.Constant(value='simple')
-                ]
-                
-                # Add variable dependencies from the assignment value
-                args = self.add_deps_to_args(node.value, args)
-                
-                tracer_call = self.create_tracer_call(EventType.ASSIGN, node, args)
-                instrumented_stmts.append(ast.Expr(value=tracer_call))
-                
-            elif isinstance(target, ast.Attribute):
-                # Attribute assignment: obj.attr = value
-                
-                # Safely copy the object reference for the tracer call
-                obj_ref = self.safe_copy_for_expression(target.value)
-                
-                args = [
-                    ast.Constant(value='obj_attr'),
-                    ast.Constant(value=target.attr),
-                    ast.Constant(value='obj'),
-                    obj_ref,
-                    ast.Constant(value='value'),
-                    self.safe_copy_for_expression(node.value),
-                    ast.Constant(value='target_type'),
-                    ast.Constant(value='attribute'),
-                    ast.Constant(value='assign_type'),
-                    ast.Constant(value='simple')
-                ]
-                
-                # Add variable dependencies from both object reference and assignment value
-                deps_from_obj = VariableCollector.get_read_variables(target.value)
-                deps_from_value = VariableCollector.get_read_variables(node.value)
-                all_deps = sorted(list(set(deps_from_obj + deps_from_value)))
-                
-                if all_deps:
-                    args.extend([
-                        ast.Constant(value='deps'),
-                        ast.List(elts=[ast.Constant(value=var) for var in all_deps], ctx=ast.Load())
-                    ])
-                
-                tracer_call = self.create_tracer_call(EventType.ASSIGN, node, args)
-                instrumented_stmts.append(ast.Expr(value=tracer_call))
-                
-            elif isinstance(target, ast.Subscript):
-                # Subscript assignment: arr[index] = value or arr[start:end] = value
-                
-                container_ref = self.safe_copy_for_expression(target.value)
-                value_ref = self.safe_copy_for_expression(node.value)
-                
-                # Collect dependencies from all parts
-                deps_from_container = VariableCollector.get_read_variables(target.value)
-                deps_from_value = VariableCollector.get_read_variables(node.value)
-                
-                # Handle different types of subscripts
-                if isinstance(target.slice, ast.Slice):
-                    # Slice assignment: arr[start:end] = value
-                    args = [
-                        ast.Constant(value='container'),
-                        container_ref,
-                        ast.Constant(value='slice_type'),
-                        ast.Constant(value='slice'),
-                        ast.Constant(value='lower'),
-                        target.slice.lower if target.slice.lower else ast.Constant(value=None),
-                        ast.Constant(value='upper'),
-                        target.slice.upper if target.slice.upper else ast.Constant(value=None),
-                        ast.Constant(value='step'),
-                        target.slice.step if target.slice.step else ast.Constant(value=None),
-                        ast.Constant(value='value'),
-                        value_ref,
-                        ast.Constant(value='target_type'),
-                        ast.Constant(value='slice'),
-                        ast.Constant(value='assign_type'),
-                        ast.Constant(value='simple')
-                    ]
-                    
-                    # Add slice bounds dependencies
-                    deps_from_slice = []
-                    if target.slice.lower:
-                        deps_from_slice.extend(VariableCollector.get_read_variables(target.slice.lower))
-                    if target.slice.upper:
-                        deps_from_slice.extend(VariableCollector.get_read_variables(target.slice.upper))
-                    if target.slice.step:
-                        deps_from_slice.extend(VariableCollector.get_read_variables(target.slice.step))
-                    
-                    all_deps = sorted(list(set(deps_from_container + deps_from_value + deps_from_slice)))
-                    
-                    tracer_call = self.create_tracer_call(EventType.ASSIGN, node, args)
-                else:
-                    # Simple subscript assignment: arr[index] = value
-                    index_ref = self.safe_copy_for_expression(target.slice)
-                    args = [
-                        ast.Constant(value='container'),
-                        container_ref,
-                        ast.Constant(value='index'),
-                        index_ref,
-                        ast.Constant(value='value'),
-                        value_ref,
-                        ast.Constant(value='target_type'),
-                        ast.Constant(value='index'),
-                        ast.Constant(value='assign_type'),
-                        ast.Constant(value='simple')
-                    ]
-                    
-                    deps_from_index = VariableCollector.get_read_variables(target.slice)
-                    all_deps = sorted(list(set(deps_from_container + deps_from_value + deps_from_index)))
-                    
-                    tracer_call = self.create_tracer_call(EventType.ASSIGN, node, args)
-                
-                # Add dependencies to args
-                if all_deps:
-                    args.extend([
-                        ast.Constant(value='deps'),
-                        ast.List(elts=[ast.Constant(value=var) for var in all_deps], ctx=ast.Load())
-                    ])
-
-                instrumented_stmts.append(ast.Expr(value=tracer_call))
+        targets = node.targets
+        if self.skip_trivial and _is_pure_constant(node.value):
+            targets = [target for target in targets if type(target) is not ast.Name]
         
-        return instrumented_stmts
+        # Keep the original assignment, then trace each target, dispatching on
+        # the target's node type
+        builders = self._assign_builders
+        tracer_stmts = [self._assign_tracer_stmt(node, *builders[type(target)](node, target))
+                        for target in targets if type(target) in builders]
+        if len(tracer_stmts) > 1:
+            # The targets of `a = b = value` are traced back to back, so a single
+            # call can record them all
+            tracer_stmts = [_batch_tracer_stmt(tracer_stmts)]
+        return [node, *tracer_stmts]
     
     def visit_AugAssign(self, node: ast.AugAssign) -> List[ast.stmt]:
         """Instrument augmented assignments (+=, -=, etc.)"""
         # First, transform children
         self.generic_visit(node)
         
-        instrumented_stmts = []
+        # Keep the original assignment, then trace the target, dispatching on its node type
+        builder = self._aug_assign_builders.get(type(node.target))
+        if builder is None:
+            return [node]
+        return [node, self._assign_tracer_stmt(node, *builder(node, node.target))]
+    
+    def _assign_tracer_stmt(self, node: ast.stmt, args: List[ast.expr], deps) -> ast.Expr:
+        """Emit the tracer statement for one assignment target from its builder's output"""
+        return _tracer_stmt(self.create_tracer_call(EventType.ASSIGN, node,
+                                                    self._finalize_args(args, deps)))
+    
+    # Assignment builders return (args without deps, set of dependencies)
+    def _build_name_assign(self, node: ast.Assign, target: ast.Name):
+        """Simple variable assignment: x = value"""
+        args = [
+            _ARG_CONSTANTS['var_name'],
+            self._name_constant(target.id),
+            _ARG_CONSTANTS['value'],
+            ast.Name(id=target.id, ctx=ast.Load()),  # Fresh node with Load context
+            _ARG_CONSTANTS['target_type'],
+            _ARG_CONSTANTS['variable'],
+            _ARG_CONSTANTS['assign_type'],
+            _ARG_CONSTANTS['simple']
+        ]
         
-        # Keep the original assignment
-        instrumented_stmts.append(node)
+        # Variable dependencies come from the assignment value
+        return args, self.get_read_variables(node.value)
+    
+    def _build_attr_assign(self, node: ast.Assign, target: ast.Attribute):
+        """Attribute assignment: obj.attr = value"""
+        args = [
+            _ARG_CONSTANTS['obj_attr'],
+            ast.Constant(value=target.attr),
+            _ARG_CONSTANTS['obj'],
+            self.safe_copy_for_expression(target.value),
+            _ARG_CONSTANTS['value'],
+            self.safe_copy_for_expression(node.value),
+            _ARG_CONSTANTS['target_type'],
+            _ARG_CONSTANTS['attribute'],
+            _ARG_CONSTANTS['assign_type'],
+            _ARG_CONSTANTS['simple']
+        ]
         
-        # Add tracing for the target
-        if isinstance(node.target, ast.Name):
-            # Simple variable: x += value
-            
-            args = [
-                ast.Constant(value='var_name'),
-                ast.Constant(value=node.target.id),
-                ast.Constant(value='value'),
-                ast.Name(id=node.target.id, ctx=ast.Load()),  # Value after assignment
-                ast.Constant(value='target_type'),
-                ast.Constant(value='variable'),
-                ast.Constant(value='assign_type'),
-                ast.Constant(value='aug')
-            ]
-            
-            # Add dependencies: both the target variable (being read) and the value expression
-            deps_from_target = [node.target.id]  # The target variable is read in augmented assignment
-            deps_from_value = VariableCollector.get_read_variables(node.value)
-            all_deps = sorted(list(set(deps_from_target + deps_from_value)))
-            
-            if all_deps:
-                args.extend([
-                    ast.Constant(value='deps'),
-                    ast.List(elts=[ast.Constant(value=var) for var in all_deps], ctx=ast.Load())
-                ])
-
-            tracer_call = self.create_tracer_call(EventType.ASSIGN, node, args)
-            instrumented_stmts.append(ast.Expr(value=tracer_call))
-            
-        elif isinstance(node.target, ast.Attribute):
-            # Attribute assignment: obj.attr += value
-            
-            obj_ref = self.safe_copy_for_expression(node.target.value)
-            
+        # Dependencies from both object reference and assignment value
+        return args, self.get_read_variables(target.value) | self.get_read_variables(node.value)
+    
+    def _build_subscript_assign(self, node: ast.Assign, target: ast.Subscript):
+        """Subscript assignment: arr[index] = value or arr[start:end] = value"""
+        container_ref = self.safe_copy_for_expression(target.value)
+        value_ref = self.safe_copy_for_expression(node.value)
+        
+        # Collect dependencies from all parts
+        deps = self.get_read_variables(target.value) | self.get_read_variables(node.value)
+        
+        # Handle different types of subscripts
+        if isinstance(target.slice, ast.Slice):
+            # Slice assignment: arr[start:end] = value
+            bounds = target.slice
             args = [
-                ast.Constant(value='obj_attr'),
-                ast.Constant(value=node.target.attr),
-                ast.Constant(value='obj'),
-                obj_ref,
-                ast.Constant(value='value'),
-                self.safe_copy_for_expression(node.target),
-                ast.Constant(value='target_type'),
-                ast.Constant(value='attribute'),
-                ast.Constant(value='assign_type'),
-                ast.Constant(value='aug')
+                _ARG_CONSTANTS['container'],
+                container_ref,
+                _ARG_CONSTANTS['slice_type'],
+                _ARG_CONSTANTS['slice'],
+                _ARG_CONSTANTS['lower'],
+                bounds.lower if bounds.lower else _ARG_CONSTANTS[None],
+                _ARG_CONSTANTS['upper'],
+                bounds.upper if bounds.upper else _ARG_CONSTANTS[None],
+                _ARG_CONSTANTS['step'],
+                bounds.step if bounds.step else _ARG_CONSTANTS[None],
+                _ARG_CONSTANTS['value'],
+                value_ref,
+                _ARG_CONSTANTS['target_type'],
+                _ARG_CONSTANTS['slice'],
+                _ARG_CONSTANTS['assign_type'],
+                _ARG_CONSTANTS['simple']
             ]
             
-            # Add dependencies from object, target attribute, and value
-            deps_from_obj = VariableCollector.get_read_variables(node.target.value)
-            deps_from_target = VariableCollector.get_read_variables(node.target)  # obj.attr is read
-            deps_from_value = VariableCollector.get_read_variables(node.value)
-            all_deps = sorted(list(set(deps_from_obj + deps_from_target + deps_from_value)))
-            
-            if all_deps:
-                args.extend([
-                    ast.Constant(value='deps'),
-                    ast.List(elts=[ast.Constant(value=var) for var in all_deps], ctx=ast.Load())
-                ])
-
-            tracer_call = self.create_tracer_call(EventType.ASSIGN, node, args)
-            instrumented_stmts.append(ast.Expr(value=tracer_call))
-            
-        elif isinstance(node.target, ast.Subscript):
-            # Subscript assignment: arr[index] += value
-            
-            container_ref = self.safe_copy_for_expression(node.target.value)
-            index_ref = self.safe_copy_for_expression(node.target.slice)
-            
+            # Add slice bounds dependencies
+            for bound in (bounds.lower, bounds.upper, bounds.step):
+                if bound:
+                    deps = deps | self.get_read_variables(bound)
+        else:
+            # Simple subscript assignment: arr[index] = value
             args = [
-                ast.Constant(value='container'),
+                _ARG_CONSTANTS['container'],
                 container_ref,
-                ast.Constant(value='index'),
-                index_ref,
-                ast.Constant(value='value'),
-                self.safe_copy_for_expression(node.target),
-                ast.Constant(value='target_type'),
-                ast.Constant(value='index'),
-                ast.Constant(value='assign_type'),
-                ast.Constant(value='aug')
+                _ARG_CONSTANTS['index'],
+                self.safe_copy_for_expression(target.slice),
+                _ARG_CONSTANTS['value'],
+                value_ref,
+                _ARG_CONSTANTS['target_type'],
+                _ARG_CONSTANTS['index'],
+                _ARG_CONSTANTS['assign_type'],
+                _ARG_CONSTANTS['simple']
             ]
             
-            # Add dependencies from container, index, target subscript, and value
-            deps_from_container = VariableCollector.get_read_variables(node.target.value)
-            deps_from_index = VariableCollector.get_read_variables(node.target.slice)
-            deps_from_target = VariableCollector.get_read_variables(node.target)  # arr[index] is read
-            deps_from_value = VariableCollector.get_read_variables(node.value)
-            all_deps = sorted(list(set(deps_from_container + deps_from_index + deps_from_target + deps_from_value)))
-            
-            if all_deps:
-                args.extend([
-                    ast.Constant(value='deps'),
-                    ast.List(elts=[ast.Constant(value=var) for var in all_deps], ctx=ast.Load())
-                ])
-            
-            tracer_call = self.create_tracer_call(EventType.ASSIGN, node, args)
-            instrumented_stmts.append(ast.Expr(value=tracer_call))
+            deps = deps | self.get_read_variables(target.slice)
         
-        return instrumented_stmts
+        return args, deps
+    
+    def _build_name_aug_assign(self, node: ast.AugAssign, target: ast.Name):
+        """Simple variable: x += value"""
+        args = [
+            _ARG_CONSTANTS['var_name'],
+            self._name_constant(target.id),
+            _ARG_CONSTANTS['value'],
+            ast.Name(id=target.id, ctx=ast.Load()),  # Value after assignment
+            _ARG_CONSTANTS['target_type'],
+            _ARG_CONSTANTS['variable'],
+            _ARG_CONSTANTS['assign_type'],
+            _ARG_CONSTANTS['aug']
+        ]
+        
+        # Dependencies: the target variable (read in augmented assignment) and the value expression
+        return args, self.get_read_variables(node.value) | {target.id}
+    
+    def _build_attr_aug_assign(self, node: ast.AugAssign, target: ast.Attribute):
+        """Attribute assignment: obj.attr += value"""
+        args = [
+            _ARG_CONSTANTS['obj_attr'],
+            ast.Constant(value=target.attr),
+            _ARG_CONSTANTS['obj'],
+            self.safe_copy_for_expression(target.value),
+            _ARG_CONSTANTS['value'],
+            self.safe_copy_for_expression(target),
+            _ARG_CONSTANTS['target_type'],
+            _ARG_CONSTANTS['attribute'],
+            _ARG_CONSTANTS['assign_type'],
+            _ARG_CONSTANTS['aug']
+        ]
+        
+        # Dependencies from the target attribute (obj.attr is read, which covers obj) and value
+        return args, self.get_read_variables(target) | self.get_read_variables(node.value)
+    
+    def _build_subscript_aug_assign(self, node: ast.AugAssign, target: ast.Subscript):
+        """Subscript assignment: arr[index] += value"""
+        args = [
+            _ARG_CONSTANTS['container'],
+            self.safe_copy_for_expression(target.value),
+            _ARG_CONSTANTS['index'],
+            self.safe_copy_for_expression(target.slice),
+            _ARG_CONSTANTS['value'],
+            self.safe_copy_for_expression(target),
+            _ARG_CONSTANTS['target_type'],
+            _ARG_CONSTANTS['index'],
+            _ARG_CONSTANTS['assign_type'],
+            _ARG_CONSTANTS['aug']
+        ]
+        
+        # Dependencies from the target subscript (arr[index] is read, which covers
+        # the container and index) and value
+        return args, self.get_read_variables(target) | self.get_read_variables(node.value)
     
     ### Function Instrumentation ###
     def visit_FunctionDef(self, node: ast.FunctionDef) -> ast.FunctionDef:
@@ -475,17 +623,22 @@ class WhylineInstrumenter(ast.NodeTransformer):
         arg_names = [ast.Name(id=arg.arg, ctx=ast.Load()) for arg in node.args.args]
         
         args = [
-            ast.Constant(value='func_name'),
+            _ARG_CONSTANTS['func_name'],
             ast.Constant(value=node.name),
-            ast.Constant(value='args'),
+            _ARG_CONSTANTS['args'],
             ast.List(elts=arg_names, ctx=ast.Load())
         ]
         
         # Add function entry tracing
         entry_tracer = self.create_tracer_call(EventType.FUNCTION_ENTRY, node, args)
         
-        # Insert at the beginning of function body
-        node.body.insert(0, ast.Expr(value=entry_tracer))
+        # Rebind the record_event alias as a fast local, then trace entry, at the
+        # beginning of the function body
+        alias_assign = ast.Assign(
+            targets=[ast.Name(id=RECORD_EVENT_ALIAS, ctx=ast.Store())],
+            value=_TRACER_FUNC
+        )
+        node.body[0:0] = [_fill_locations(alias_assign, node), _tracer_stmt(entry_tracer)]
         
         return node
     
@@ -497,103 +650,118 @@ class WhylineInstrumenter(ast.NodeTransformer):
         if node.value is not None:
             return_value = self.safe_copy_for_expression(node.value)
         else:
-            return_value = ast.Constant(value=None)
+            return_value = _ARG_CONSTANTS[None]
         
         args = [
-            ast.Constant(value='value'),
+            _ARG_CONSTANTS['value'],
             return_value
         ]
         
         # Add return tracing
         tracer_call = self.create_tracer_call(EventType.RETURN, node, args)
         
-        return [ast.Expr(value=tracer_call), node]
+        return [_tracer_stmt(tracer_call), node]
    
     def visit_Call(self, node: ast.Call) -> ast.Call:
         """Instrument function calls (basic version)"""
-        self.generic_visit(node)
-        
-        return node 
+        # Calls are expressions and cannot contain statements, so there is
+        # nothing to instrument below them
+        return node
+    
+    def visit_Lambda(self, node: ast.Lambda) -> ast.Lambda:
+        """Leave lambdas untouched: their body is an expression, with nothing to instrument"""
+        return node
+    
+    # Comprehensions and generator expressions cannot contain statements either
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = visit_Lambda
     
     ### Control Flow ###
     def visit_If(self, node: ast.If) -> List[ast.stmt]:
         """Instrument if statements with integrated condition and branch logic"""
+        guard_test = None
+        if self.run_main_guards and _is_main_guard(node.test):
+            guard_test = node.test
+            node.test = ast.copy_location(ast.Constant(value=True), guard_test)
+            self.main_guards_rewritten += 1
+        
         # Transform children first
         self.generic_visit(node)
+        # Branch events describe the test as written, even for a rewritten guard
+        test = guard_test or node.test
         
-        # Get condition as string for debugging
-        condition_str = ast.unparse(node.test) if hasattr(ast, 'unparse') else str(node.test)
-        condition_copy = self.safe_copy_for_expression(node.test)
+        # Condition source for debugging; one Constant is shared by both branch events
+        condition_const = ast.Constant(value=ast.unparse(test))
+        condition_copy = self.safe_copy_for_expression(test)
         
         # Track variable reads in the condition BEFORE the if statement
         instrumented_stmts = []
         
         # Add branch tracing to if body (if condition is true)
         if_args = [
-            ast.Constant(value='condition'),
-            ast.Constant(value=condition_str),
-            ast.Constant(value='result'),
+            _ARG_CONSTANTS['condition'],
+            condition_const,
+            _ARG_CONSTANTS['result'],
             condition_copy,
-            ast.Constant(value='decision'),
-            ast.Constant(value='if_block')
+            _ARG_CONSTANTS['decision'],
+            _ARG_CONSTANTS['if_block']
         ]
         
         # Add dependencies from the condition
-        if_args = self.add_deps_to_args(node.test, if_args)
+        if_args = self.add_deps_to_args(test, if_args)
         
         if_tracer = self.create_tracer_call(EventType.BRANCH, node, if_args)
-        node.body.insert(0, ast.Expr(value=if_tracer))
+        node.body.insert(0, _tracer_stmt(if_tracer))
         
         # Handle else/skip cases
         if node.orelse:
             if len(node.orelse) == 1 and isinstance(node.orelse[0], ast.If):
                 # elif case - add branch event for when this condition is false and goes to elif
                 elif_args = [
-                    ast.Constant(value='condition'),
-                    ast.Constant(value=condition_str),
-                    ast.Constant(value='result'),
+                    _ARG_CONSTANTS['condition'],
+                    condition_const,
+                    _ARG_CONSTANTS['result'],
                     condition_copy,
-                    ast.Constant(value='decision'),
-                    ast.Constant(value='elif_block')
+                    _ARG_CONSTANTS['decision'],
+                    _ARG_CONSTANTS['elif_block']
                 ]
                 
                 # Add dependencies from the condition
-                elif_args = self.add_deps_to_args(node.test, elif_args)
+                elif_args = self.add_deps_to_args(test, elif_args)
                 
                 elif_tracer = self.create_tracer_call(EventType.BRANCH, node, elif_args)
-                node.orelse.insert(0, ast.Expr(value=elif_tracer))
+                node.orelse.insert(0, _tracer_stmt(elif_tracer))
             else:
                 # explicit else case (condition is false, else block taken)
                 else_args = [
-                    ast.Constant(value='condition'),
-                    ast.Constant(value=condition_str),
-                    ast.Constant(value='result'),
+                    _ARG_CONSTANTS['condition'],
+                    condition_const,
+                    _ARG_CONSTANTS['result'],
                     condition_copy,
-                    ast.Constant(value='decision'),
-                    ast.Constant(value='else_block')
+                    _ARG_CONSTANTS['decision'],
+                    _ARG_CONSTANTS['else_block']
                 ]
                 
                 # Add dependencies from the condition
-                else_args = self.add_deps_to_args(node.test, else_args)
+                else_args = self.add_deps_to_args(test, else_args)
                 
                 else_tracer = self.create_tracer_call(EventType.BRANCH, node, else_args)
-                node.orelse.insert(0, ast.Expr(value=else_tracer))
+                node.orelse.insert(0, _tracer_stmt(else_tracer))
         else:
             # No else block - create skip branch for when condition is false
             skip_args = [
-                ast.Constant(value='condition'),
-                ast.Constant(value=condition_str),
-                ast.Constant(value='result'),
+                _ARG_CONSTANTS['condition'],
+                condition_const,
+                _ARG_CONSTANTS['result'],
                 condition_copy,
-                ast.Constant(value='decision'),
-                ast.Constant(value='skip_block')
+                _ARG_CONSTANTS['decision'],
+                _ARG_CONSTANTS['skip_block']
             ]
             
             # Add dependencies from the condition
-            skip_args = self.add_deps_to_args(node.test, skip_args)
+            skip_args = self.add_deps_to_args(test, skip_args)
             
             skip_tracer = self.create_tracer_call(EventType.BRANCH, node, skip_args)
-            node.orelse = [ast.Expr(value=skip_tracer)]
+            node.orelse = [_tracer_stmt(skip_tracer)]
         
         # Add the instrumented if statement
         instrumented_stmts.append(node)
@@ -605,23 +773,31 @@ class WhylineInstrumenter(ast.NodeTransformer):
         self.generic_visit(node)
         
         # Get target variable name
-        if isinstance(node.target, ast.Name):
-            target_name = node.target.id
+        target = node.target
+        if type(target) is ast.Name:
+            target_name = target.id
             target_ref = ast.Name(id=target_name, ctx=ast.Load())
+        elif type(target) in (ast.Tuple, ast.List):
+            # Unpacking target: for a, b in items -> record the values of a and b
+            names = _unpacked_names(target)
+            target_name = ', '.join(names)
+            target_ref = ast.List(elts=[ast.Name(id=name, ctx=ast.Load()) for name in names],
+                                  ctx=ast.Load())
         else:
-            target_name = str(node.target)
-            target_ref = ast.Constant(value=target_name)
+            # Attribute or subscript target: record where it binds, without a value
+            target_name = ast.unparse(target)
+            target_ref = _ARG_CONSTANTS[None]
         
         args = [
-            ast.Constant(value='target'),
+            _ARG_CONSTANTS['target'],
             ast.Constant(value=target_name),
-            ast.Constant(value='iter_value'),
+            _ARG_CONSTANTS['iter_value'],
             target_ref
         ]
         
         # Add loop iteration tracing
         loop_tracer = self.create_tracer_call(EventType.LOOP_ITERATION, node, args)
-        node.body.insert(0, ast.Expr(value=loop_tracer))
+        node.body.insert(0, _tracer_stmt(loop_tracer))
         
         return node
     
@@ -630,7 +806,7 @@ class WhylineInstrumenter(ast.NodeTransformer):
         self.generic_visit(node)
         
         # Get condition as string for debugging
-        condition_str = ast.unparse(node.test) if hasattr(ast, 'unparse') else str(node.test)
+        condition_str = ast.unparse(node.test)
         
         # Create a unique variable name for storing condition result
         condition_var = f'_whyline_while_condition_{self.get_next_event_id()}'
@@ -651,9 +827,9 @@ class WhylineInstrumenter(ast.NodeTransformer):
         
         # 2. Create tracer call arguments
         args = [
-            ast.Constant(value='condition'),
+            _ARG_CONSTANTS['condition'],
             ast.Constant(value=condition_str),
-            ast.Constant(value='result'),
+            _ARG_CONSTANTS['result'],
             ast.Name(id=condition_var, ctx=ast.Load())
         ]
         
@@ -662,7 +838,7 @@ class WhylineInstrumenter(ast.NodeTransformer):
         
         # 3. Create tracer call
         while_tracer = self.create_tracer_call(EventType.WHILE_CONDITION, node, args)
-        tracer_stmt = ast.Expr(value=while_tracer)
+        tracer_stmt = _tracer_stmt(while_tracer)
         
         # 4. Create break condition with else clause handling
         # For else clauses to work properly with break, we need a different approach
@@ -719,9 +895,9 @@ class WhylineInstrumenter(ast.NodeTransformer):
             
             # Copy location information
             ast.copy_location(new_while, node)
-            ast.copy_location(condition_assignment, node)
-            ast.copy_location(tracer_stmt, node)
-            ast.copy_location(break_condition, node)
+            ast.copy_location(new_while.test, node)
+            _fill_locations(condition_assignment, node)
+            _fill_locations(break_condition, node)
             
             return new_while
         else:
@@ -747,92 +923,169 @@ class WhylineInstrumenter(ast.NodeTransformer):
             
             # Copy location information
             ast.copy_location(new_while, node)
-            ast.copy_location(condition_assignment, node)
-            ast.copy_location(tracer_stmt, node)
-            ast.copy_location(break_condition, node)
+            ast.copy_location(new_while.test, node)
+            _fill_locations(condition_assignment, node)
+            _fill_locations(break_condition, node)
             
             return new_while
     
 
-# Helper function to instrument code
-def instrument_code(source_code: str, filename: str = "<string>") -> str:
-    """Instrument Python source code with Whyline tracing"""
-    
-    # Parse the source code
+def _parse_source(source_code: str, filename: str) -> ast.Module:
+    """Parse source code, reporting syntax errors as ValueError"""
     try:
-        tree = ast.parse(source_code, filename=filename)
+        return ast.parse(source_code, filename=filename)
     except SyntaxError as e:
         raise ValueError(f"Syntax error in source code: {e}")
+
+
+def _transform_source(source_code: str, instrumenter: WhylineInstrumenter) -> ast.Module:
+    """Parse source code and apply the Whyline transformation"""
+    return instrumenter.visit(_parse_source(source_code, instrumenter.filename))
+
+
+# Top-level statements ast.unparse separates from the previous one by a blank line
+_BLANK_LINE_BEFORE = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+def _iter_instrumented_source(tree: ast.Module, instrumenter: WhylineInstrumenter):
+    """Instrument and unparse a module one top-level statement at a time.
     
-    # Transform the AST
-    instrumenter = WhylineInstrumenter(filename)
-    instrumented_tree = instrumenter.visit(tree)
+    Each statement is dropped from the tree once unparsed, so only one
+    statement's instrumented nodes are alive at a time. The chunks join to
+    exactly what ast.unparse produces for the whole instrumented module.
+    """
+    for stmt in _PRELUDE:
+        if stmt is not _PRELUDE[0]:
+            yield '\n'
+        yield ast.unparse(stmt)
+    
+    body = tree.body
+    for index, stmt in enumerate(body):
+        body[index] = None
+        transformed = instrumenter.visit(stmt)
+        if transformed is None:
+            continue
+        for new_stmt in transformed if isinstance(transformed, list) else (transformed,):
+            yield '\n\n' if isinstance(new_stmt, _BLANK_LINE_BEFORE) else '\n'
+            yield ast.unparse(new_stmt)
+
+
+def instrument_ast(source_code: str, filename: str = "<string>",
+                   run_main_guards: bool = False, skip_trivial: bool = False) -> ast.Module:
+    """Instrument Python source code and return the transformed AST, ready to compile"""
+    instrumenter = WhylineInstrumenter(filename, run_main_guards, skip_trivial)
+    return _transform_source(source_code, instrumenter)
+
+
+# Helper function to instrument code
+@lru_cache(maxsize=64)
+def instrument_code(source_code: str, filename: str = "<string>", skip_trivial: bool = False) -> str:
+    """Instrument Python source code with Whyline tracing.
     
-    # Fix missing line numbers and column offsets
-    ast.fix_missing_locations(instrumented_tree)
+    Results are memoized per (source_code, filename, skip_trivial), so
+    re-instrumenting the same script during a debugging session skips parse,
+    transform and unparse. skip_trivial leaves assignments of constant
+    literals to names untraced.
+    """
+    tree = _parse_source(source_code, filename)
+    instrumenter = WhylineInstrumenter(filename, skip_trivial=skip_trivial)
     
-    # Convert back to source code
+    # Generated nodes are located as they are built, so statements unparse as is
     try:
-        return ast.unparse(instrumented_tree)
+        return ''.join(_iter_instrumented_source(tree, instrumenter))
     except Exception as e:
         raise ValueError(f"Failed to unparse instrumented AST: {e}")
+
+
+# Globals every exec_instrumented run starts from
+_EXEC_GLOBALS = {
+    # The tracer and its record_event alias; the compiled code has no prelude of its own
+    '_whyline_tracer': get_tracer(),
+    RECORD_EVENT_ALIAS: get_tracer().record_event,
+    '__builtins__': builtins,
+    # Set __name__ to __main__ to ensure if __name__ == "__main__" blocks execute
+    '__name__': '__main__',
+    # Set __file__ to avoid NameError if the code references it
+    '__file__': '<string>',
+}
+
+
+@lru_cache(maxsize=32)
+def _compile_instrumented(source_code: str, filename: str = "<string>", skip_trivial: bool = False):
+    """Instrument and compile source code, memoized on the source text.
     
-def exec_instrumented(source_code: str, globals_dict: Dict[str, Any] = None) -> Dict[str, Any]:
-    """Execute instrumented Python code"""
-    
-    if globals_dict is None:
-        globals_dict = {}
+    Re-running identical code (e.g. repeated CLI 'run' commands) skips the
+    AST pass and compilation. The code object is executed against a fresh
+    globals dict each time, so caching it is safe.
     
-    # Add the tracer to globals
-    globals_dict['_whyline_tracer'] = get_tracer()
+    `__main__` guards are rewritten to run, as the code is exec'd as a script.
+    """
+    # exec_instrumented seeds the tracer globals, so the prelude import is left out
+    instrumenter = WhylineInstrumenter(filename, run_main_guards=True, skip_trivial=skip_trivial,
+                                       standalone=False)
+    tree = _transform_source(source_code, instrumenter)
+    # Compile the transformed tree directly instead of unparsing and re-parsing it
+    return compile(tree, filename, 'exec')
+
     
-    # Add built-ins
-    globals_dict['__builtins__'] = builtins
+def exec_instrumented(source_code: str, globals_dict: Dict[str, Any] = None,
+                      skip_trivial: bool = False) -> Dict[str, Any]:
+    """Execute instrumented Python code.
     
-    # Set __name__ to __main__ to ensure if __name__ == "__main__" blocks execute
-    globals_dict['__name__'] = '__main__'
+    skip_trivial leaves assignments of constant literals to names untraced.
+    """
     
-    # Set __file__ to avoid NameError if the code references it
-    globals_dict['__file__'] = '<string>'
+    if globals_dict is None:
+        globals_dict = _EXEC_GLOBALS.copy()
+    else:
+        globals_dict.update(_EXEC_GLOBALS)
     
-    # Handle __name__ == "__main__" guards by replacing them with if True:
-    code_to_run = source_code
-    if 'if __name__ == "__main__":' in code_to_run:
-        code_to_run = code_to_run.replace('if __name__ == "__main__":', 'if True:')
-        print("(Modified __name__ check to run main code)")
- 
-
     try:
-        if sys.version_info < (3, 9):
-            raise RuntimeError("AST-based instrumentation requires Python 3.9 or higher.")
-            
-        # Use string-based approach for Python 3.9+
-        instrumented_code = instrument_code(code_to_run, "<string>")
-        exec(instrumented_code, globals_dict)
+        # __name__ == "__main__" guards are rewritten to `if True:` during instrumentation
+        exec(_compile_instrumented(source_code, "<string>", skip_trivial), globals_dict)
                 
     except Exception as e:
         print(f"Error during instrumentation: {e}")
         print("Falling back to original code execution...")
-        exec(code_to_run, globals_dict, globals_dict)
+        exec(source_code, globals_dict, globals_dict)
     
     return globals_dict
 
-def instrument_file(source_file: str, output_file: str = None) -> str:
-    """Instrument a Python file with Whyline tracing"""
+def instrument_file(source_file: str, output_file: str = None,
+                    format: str = 'source') -> Union[str, CodeType]:
+    """Instrument a Python file with Whyline tracing.
+    
+    With format='source' the instrumented source is returned (and written to
+    output_file). With format='marshal' the instrumented tree is compiled
+    without unparsing it, and the code object is returned and marshalled to
+    output_file; load it with marshal.load and exec it in any namespace.
+    
+    If instrumentation fails, the error is printed and the original code is
+    returned (and written) instead, in the requested format.
+    """
+    if format not in ('source', 'marshal'):
+        raise ValueError(f"Unknown output format: {format!r}")
     
     with open(source_file, 'r') as f:
         source_code = f.read()
     
+    if format == 'marshal':
+        try:
+            code = compile(instrument_ast(source_code, source_file), source_file, 'exec')
+        except Exception as e:
+            print(f"Error instrumenting file {source_file}: {e}")
+            code = compile(source_code, source_file, 'exec')
+        if output_file:
+            with open(output_file, 'wb') as f:
+                marshal.dump(code, f)
+        return code
+    
     try:
         instrumented_code = instrument_code(source_code, source_file)
         
         if output_file:
             with open(output_file, 'w') as f:
-                if isinstance(instrumented_code, str):
-                    f.write(instrumented_code)
-                else:
-                    f.write("# Compiled code object - cannot write to file\n")
-                    f.write(f"# Original file: {source_file}\n")
+                f.write(instrumented_code)
         
         return instrumented_code
         
@@ -841,7 +1094,43 @@ def instrument_file(source_file: str, output_file: str = None) -> str:
         return source_code
 
 
+def _instrument_file_job(paths):
+    """Process pool entry point: instrument one (source_file, output_file) pair"""
+    source_file, output_file = paths
+    return instrument_file(source_file, output_file)
 
 
-
-
+def instrument_files(paths: List[str], output_dir: Optional[str] = None,
+                     workers: Optional[int] = None) -> Dict[str, str]:
+    """Instrument several Python files in parallel worker processes.
+    
+    Files are independent, so each is parsed, transformed and unparsed in its own
+    worker. If output_dir is given, the instrumented files are written there,
+    keeping their layout relative to the sources' common directory.
+    
+    Returns a dict mapping each source path to its instrumented code.
+    """
+    paths = list(paths)
+    if not paths:
+        return {}
+    
+    if output_dir:
+        base_dir = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+        output_files = []
+        for path in paths:
+            output_file = os.path.join(output_dir, os.path.relpath(os.path.abspath(path), base_dir))
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            output_files.append(output_file)
+    else:
+        output_files = [None] * len(paths)
+    
+    jobs = list(zip(paths, output_files))
+    if len(jobs) == 1 or workers == 1:
+        results = map(_instrument_file_job, jobs)
+    else:
+        # Imported here: it pulls in multiprocessing, which only batch runs need
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_instrument_file_job, jobs))
+    
+    return dict(zip(paths, results))
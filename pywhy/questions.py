@@ -4,9 +4,67 @@ Allows users to ask "why" and "why not" questions about program execution.
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Any, Optional
+from typing import Dict, List, Any, Optional, Sequence
 from dataclasses import dataclass, field
-from .tracer import TraceEvent, WhylineTracer
+from .events import EventType, TraceEvent
+from .tracer import WhylineTracer
+
+# Event types that start a new frame or decide control flow; they end a linear chain
+_CHAIN_BREAKING_TYPES = frozenset({
+    EventType.FUNCTION_ENTRY,
+    EventType.RETURN,
+    EventType.BRANCH,
+    EventType.WHILE_CONDITION,
+    EventType.LOOP_ITERATION,
+})
+
+
+def compress_event_chains(events: List[TraceEvent],
+                          trace_events: Sequence[TraceEvent]) -> List[TraceEvent]:
+    """Collapse linear chains of events, keeping only the first and last of each.
+    
+    A chain is a run of events, listed in trace order, that sit at consecutive
+    positions of ``trace_events`` (the full trace the events were taken from),
+    were recorded in the same frame, and each depend only on the variable the
+    previous one assigned. Interior events of such a run add no new decision
+    points; events with dependencies of their own are never dropped. Event ids
+    are instrumentation sites, not trace positions, so they are not used here.
+    """
+    wanted = {id(event) for event in events}
+    positions = {id(event): index for index, event in enumerate(trace_events)
+                 if id(event) in wanted}
+    
+    compressed = []
+    chain: List[TraceEvent] = []
+    
+    def flush():
+        if len(chain) > 2:
+            compressed.extend((chain[0], chain[-1]))
+        else:
+            compressed.extend(chain)
+        chain.clear()
+    
+    for event in events:
+        if event.event_type in _CHAIN_BREAKING_TYPES:
+            flush()
+            compressed.append(event)
+            continue
+        position = positions.get(id(event))
+        if chain:
+            previous = chain[-1]
+            previous_position = positions.get(id(previous))
+            if not (position is not None and previous_position is not None and
+                    position == previous_position + 1 and
+                    event.frame_id == previous.frame_id and
+                    event.thread_id == previous.thread_id and
+                    previous.get_var_name() is not None and
+                    event.get_deps() == [previous.get_var_name()]):
+                flush()
+        chain.append(event)
+    flush()
+    
+    return compressed
+
 
 @dataclass
 class Answer:
@@ -14,6 +72,15 @@ class Answer:
     question: 'Question'
     explanation: str
     evidence: List[TraceEvent] = field(default_factory=list)
+    # Whether display_evidence() collapses linear event chains; evidence stays raw.
+    # Off by default: compressing hides interior dependencies from the user.
+    compress: bool = False
+    
+    def display_evidence(self) -> List[TraceEvent]:
+        """Get the evidence to show to the user, compressed if enabled"""
+        if self.compress and self.question is not None:
+            return compress_event_chains(self.evidence, self.question.tracer.events)
+        return self.evidence
     
     def __str__(self) -> str:
         return self.explanation
@@ -58,6 +125,15 @@ class Question(ABC):
         """Analyze the trace to answer the question"""
         pass
     
+    def _events_of_type(self, *event_types: EventType, filename: str = None) -> List[TraceEvent]:
+        """Get the events of the given types in trace order, optionally from one file.
+        
+        Candidates are selected from the store's type index and filename column
+        before any event object is touched.
+        """
+        events = self.tracer.events
+        return [events[i] for i in events.indices_where(event_types, filename)]
+    
     def get_answer(self) -> Answer:
         """Get the answer, computing it if necessary"""
         if self.answer is None:
@@ -85,12 +161,15 @@ class WhyDidVariableHaveValue(Question):
         
     def analyze(self) -> ValueSourceAnswer:
         """Find where the variable got its value"""
-        # Find assignment events for this variable
+        # Find assignment events for this variable, seeded from the variable
+        # index instead of scanning every event in the trace
         assignments = []
+        events = self.tracer.events
         
-        for event in self.tracer.events:
-            if (event.event_type in ['assign', 'aug_assign'] and 
-                event.data.get('var_name') == self.var_name):
+        for i in events.indices_for_var(self.var_name):
+            event = events[i]
+            # Augmented assignments are ASSIGN events too (assign_type 'aug')
+            if event.event_type == EventType.ASSIGN:
                 
                 # Check if this is the right file and line
                 # Handle filename mismatch between CLI and tracer
@@ -143,15 +222,14 @@ class WhyDidVariableHaveValue(Question):
         if assignment_event.data.get('deps'):
             # Look for earlier assignment events that created the dependent variables
             deps = assignment_event.data.get('deps', [])
-            for event in self.tracer.events:
+            events = self.tracer.events
+            indices = sorted({i for var_name in deps for i in events.indices_for_var(var_name)})
+            for i in indices:
+                event = events[i]
                 if (event.event_id < assignment_event.event_id and
                     event.filename == assignment_event.filename and
-                    event.event_type in ['assign', 'aug_assign']):
-                    
-                    # Check if this event assigned to one of our dependencies
-                    var_name = event.data.get('var_name')
-                    if var_name in deps:
-                        dependencies.append(event)
+                    event.event_type == EventType.ASSIGN):
+                    dependencies.append(event)
         
         return dependencies
 
@@ -166,17 +244,17 @@ class WhyDidFunctionReturn(Question):
         
     def analyze(self) -> ValueSourceAnswer:
         """Find why the function returned this value using dynamic slicing"""
-        # Find return events for this function
-        return_events = []
-        
-        for event in self.tracer.events:
-            if event.event_type == 'return':
-                
-                # Check if this return matches our expected function and value
-                if event.data.get('value') == self.return_value:
-                    return_events.append(event)
-        
-        if not return_events:
+        # Only the most recent matching return is used, so scan the return
+        # events backwards and stop at the first match
+        events = self.tracer.events
+        target_return = None
+        for i in reversed(events.indices_where([EventType.RETURN])):
+            # Check if this return matches our expected function and value
+            if events[i].data.get('value') == self.return_value:
+                target_return = events[i]
+                break
+        
+        if target_return is None:
             explanation = f"No return found for function '{self.func_name}' with value '{self.return_value}'"
             return ValueSourceAnswer(
                 question=self,
@@ -185,9 +263,6 @@ class WhyDidFunctionReturn(Question):
                 source_events=[]
             )
         
-        # Use the most recent matching return event
-        target_return = return_events[-1]
-        
         # Perform dynamic slicing to find data dependencies leading to this return
         dependencies = self._find_return_dependencies(target_return)
         
@@ -206,17 +281,18 @@ class WhyDidFunctionReturn(Question):
         """Find the chain of events that led to this return value using deps information"""
         dependencies = []
         
-        # Look for events with deps that occurred before the return
-        for event in self.tracer.events:
-            if (event.event_id < return_event.event_id and
-                event.filename == return_event.filename):
+        # Look for events with deps that occurred before the return, in its file
+        events = self.tracer.events
+        for i in events.indices_where(filename=return_event.filename):
+            event = events[i]
+            if event.event_id < return_event.event_id:
                 
                 # Include events that have dependency information
                 if event.data.get('deps'):
                     dependencies.append(event)
                 
                 # Include assignments that contributed to the return value
-                elif (event.event_type in ['assign', 'aug_assign'] and
+                elif (event.event_type == EventType.ASSIGN and
                       event.data.get('value') == self.return_value):
                     dependencies.append(event)
         
@@ -235,13 +311,18 @@ class WhyWasFunctionCalled(Question):
         
     def analyze(self) -> ExecutionAnswer:
         """Find why the function was called using control flow analysis"""
-        # Find call events for this function
+        # Find call events for this function: instrumented functions record a
+        # FUNCTION_ENTRY each time they are called
         call_events = []
+        call_indices = []
         
-        for event in self.tracer.events:
-            if (event.event_type == 'call_pre' and 
-                event.data.get('func_name') == self.func_name):
+        # Seeded from the function name index instead of scanning every call
+        events = self.tracer.events
+        for i in events.indices_for_func(self.func_name):
+            event = events[i]
+            if event.event_type == EventType.FUNCTION_ENTRY:
                 call_events.append(event)
+                call_indices.append(i)
         
         if not call_events:
             explanation = f"Function '{self.func_name}' was never called"
@@ -257,7 +338,7 @@ class WhyWasFunctionCalled(Question):
         target_call = call_events[-1]
         
         # Find control flow dependencies that led to this call
-        dependencies = self._find_call_dependencies(target_call)
+        dependencies = self._find_call_dependencies(target_call, call_indices[-1])
         
         explanation = f"Function '{self.func_name}' was called {len(call_events)} times"
         if dependencies:
@@ -271,24 +352,28 @@ class WhyWasFunctionCalled(Question):
             dependencies=dependencies
         )
     
-    def _find_call_dependencies(self, call_event: TraceEvent) -> List[TraceEvent]:
+    def _find_call_dependencies(self, call_event: TraceEvent, call_index: int) -> List[TraceEvent]:
         """Find the control flow events that led to this function call"""
         dependencies = []
         
-        # Look for branch and condition events that occurred before the call
-        for event in self.tracer.events:
-            if (event.event_id < call_event.event_id and
-                event.event_type in ['branch', 'condition'] and
-                event.filename == call_event.filename):
-                dependencies.append(event)
+        # Look for branch events recorded before the call; event ids are
+        # instrumentation sites, so trace positions decide what came first
+        events = self.tracer.events
+        for i in events.indices_where([EventType.BRANCH], filename=call_event.filename):
+            if i >= call_index:
+                break
+            dependencies.append(events[i])
         
         return dependencies
 
 
 class WhyDidntFieldChange(Question):
-    """Question about why a field's value didn't change after a certain time"""
+    """Question about why a field's value didn't change after a certain time.
     
-    def __init__(self, tracer: WhylineTracer, field_name: str, after_time: float, 
+    ``after_time`` is an event timestamp: integer nanoseconds since the trace started.
+    """
+    
+    def __init__(self, tracer: WhylineTracer, field_name: str, after_time: int, 
                  object_id: int = None):
         super().__init__(tracer, field_name, f"Why didn't field '{field_name}' change after time {after_time}")
         self.field_name = field_name
@@ -301,16 +386,12 @@ class WhyDidntFieldChange(Question):
         field_assignments = []
         potential_assignments = []
         
-        for event in self.tracer.events:
-            if event.timestamp > self.after_time:
-                # Check for actual assignments
-                if (event.event_type == 'assign' and 
-                    event.data.get('var_name') == self.field_name):
-                    field_assignments.append(event)
-                
-                # Check for potential assignment sites (lines that could assign to this field)
-                elif self.field_name in event.locals_snapshot:
-                    potential_assignments.append(event)
+        # Actual assignments, seeded from the variable index
+        events = self.tracer.events
+        for i in events.indices_for_var(self.field_name):
+            event = events[i]
+            if event.timestamp > self.after_time and event.event_type == EventType.ASSIGN:
+                field_assignments.append(event)
         
         if field_assignments:
             explanation = f"Field '{self.field_name}' actually did change {len(field_assignments)} times after the specified time"
@@ -322,6 +403,13 @@ class WhyDidntFieldChange(Question):
                 dependencies=[]
             )
         
+        # Check for potential assignment sites (lines that could assign to this field),
+        # recorded after the given time
+        for i in events.indices_after(self.after_time):
+            event = events[i]
+            if self.field_name in event.locals_snapshot:
+                potential_assignments.append(event)
+        
         # Analyze why potential assignment sites didn't execute or assign
         blocking_control_flow = self._find_blocking_control_flow_for_field()
         
@@ -343,11 +431,12 @@ class WhyDidntFieldChange(Question):
         """Find control flow events that prevented field assignment"""
         blocking_events = []
         
-        # Look for branch events after the specified time that might have blocked assignment
-        for event in self.tracer.events:
-            if (event.timestamp > self.after_time and
-                event.event_type in ['branch', 'condition']):
-                blocking_events.append(event)
+        # Look for branch events after the specified time that might have blocked
+        # assignment, narrowing the branch index to the time window
+        events = self.tracer.events
+        branch_indices = events.indices_where([EventType.BRANCH])
+        for i in events.indices_after(self.after_time, branch_indices):
+            blocking_events.append(events[i])
         
         return blocking_events
 
@@ -365,14 +454,13 @@ class WhyDidObjectGetCreated(Question):
         # Find instantiation events (assignments that create new objects)
         creation_events = []
         
-        for event in self.tracer.events:
-            if event.event_type == 'assign':
-                # Check if any value in locals looks like an object creation
-                for var_name, var_value in event.locals_snapshot.items():
-                    if (hasattr(var_value, '__class__') and 
-                        var_value.__class__.__name__ == self.object_type):
-                        creation_events.append(event)
-                        break
+        for event in self._events_of_type(EventType.ASSIGN):
+            # Check if any value in locals looks like an object creation
+            for var_name, var_value in event.locals_snapshot.items():
+                if (hasattr(var_value, '__class__') and 
+                    var_value.__class__.__name__ == self.object_type):
+                    creation_events.append(event)
+                    break
         
         if not creation_events:
             explanation = f"No creation found for objects of type '{self.object_type}'"
@@ -406,11 +494,9 @@ class WhyDidObjectGetCreated(Question):
         """Find the control flow events that led to object creation"""
         dependencies = []
         
-        # Look for branch and condition events that occurred before the creation
-        for event in self.tracer.events:
-            if (event.event_id < creation_event.event_id and
-                event.event_type in ['branch', 'condition'] and
-                event.filename == creation_event.filename):
+        # Look for branch events that occurred before the creation
+        for event in self._events_of_type(EventType.BRANCH, filename=creation_event.filename):
+            if event.event_id < creation_event.event_id:
                 dependencies.append(event)
         
         return dependencies
@@ -433,10 +519,10 @@ class WhyDidConditionEvaluateTo(Question):
         condition_events = []
         read_dependencies = []
         
-        for event in self.tracer.events:
+        assign_events = None
+        for event in self._events_of_type(EventType.BRANCH):
             # Look for branch events with matching condition
-            if (event.event_type == 'branch' and 
-                event.data.get('condition') == self.condition_text and
+            if (event.data.get('condition') == self.condition_text and
                 event.data.get('result') == self.expected_result):
                 
                 if self.filename and event.filename != self.filename and event.filename != "<string>":
@@ -450,10 +536,11 @@ class WhyDidConditionEvaluateTo(Question):
                 if event.data.get('deps'):
                     deps = event.data.get('deps', [])
                     # Find assignment events that created the dependent variables
-                    for dep_event in self.tracer.events:
+                    if assign_events is None:
+                        assign_events = self._events_of_type(EventType.ASSIGN)
+                    for dep_event in assign_events:
                         if (dep_event.event_id < event.event_id and
-                            dep_event.filename == event.filename and
-                            dep_event.event_type in ['assign', 'aug_assign']):
+                            dep_event.filename == event.filename):
                             
                             var_name = dep_event.data.get('var_name')
                             if var_name in deps:
@@ -491,17 +578,16 @@ class WhyDidPropertyGetAssigned(Question):
         # Find assignment events for this property
         assignments = []
         
-        for event in self.tracer.events:
-            if event.event_type == 'assign':
-                # Check if this looks like a property assignment
-                if (event.data.get('var_name') == self.property_name and
-                    event.data.get('value') == self.value):
+        for event in self._events_of_type(EventType.ASSIGN):
+            # Check if this looks like a property assignment
+            if (event.data.get('var_name') == self.property_name and
+                event.data.get('value') == self.value):
+                assignments.append(event)
+            
+            # Also check locals for the property
+            elif self.property_name in event.locals_snapshot:
+                if event.locals_snapshot[self.property_name] == self.value:
                     assignments.append(event)
-                
-                # Also check locals for the property
-                elif self.property_name in event.locals_snapshot:
-                    if event.locals_snapshot[self.property_name] == self.value:
-                        assignments.append(event)
         
         if not assignments:
             explanation = f"No assignment found for property '{self.property_name}' with value '{self.value}'"
@@ -534,9 +620,8 @@ class WhyDidPropertyGetAssigned(Question):
         dependencies = []
         
         # Look for earlier events that produced this value
-        for event in self.tracer.events:
-            if (event.event_id < assignment_event.event_id and
-                event.event_type in ['assign', 'call_post', 'return']):
+        for event in self._events_of_type(EventType.ASSIGN, EventType.RETURN):
+            if event.event_id < assignment_event.event_id:
                 
                 # Check if any value in this event matches our target value
                 if self.value in event.data.values():
@@ -548,39 +633,71 @@ class WhyDidPropertyGetAssigned(Question):
 
 
 class QuestionAsker:
-    """Factory class for creating questions"""
+    """Factory class for creating questions.
+    
+    Asking the same question again on an unchanged trace returns the earlier
+    question, so its memoized answer is reused instead of rescanning the trace.
+    """
     
     def __init__(self, tracer: WhylineTracer):
         self.tracer = tracer
+        # (question class, arguments) -> question, for the trace as of the last ask
+        self._questions: Dict[tuple, Question] = {}
+        self._trace_length = 0
+        self._trace_last_event: Optional[TraceEvent] = None
+    
+    def _question(self, question_type: type, *args) -> Question:
+        """Get a question, reusing the one asked earlier with equal arguments.
+        
+        The trace counts as unchanged while its length and last event are the
+        same, which also catches a clear() followed by a run of equal length.
+        """
+        events = self.tracer.events
+        last_event = events[-1] if events else None
+        if len(events) != self._trace_length or last_event is not self._trace_last_event:
+            self._questions.clear()
+            self._trace_length = len(events)
+            self._trace_last_event = last_event
+        
+        # Argument types are part of the key so that e.g. 1 and True stay distinct
+        key = (question_type, args, tuple(map(type, args)))
+        try:
+            question = self._questions.get(key)
+        except TypeError:
+            # Unhashable argument values (lists, dicts) are not memoized
+            return question_type(self.tracer, *args)
+        if question is None:
+            question = self._questions[key] = question_type(self.tracer, *args)
+        return question
         
     def why_did_variable_have_value(self, var_name: str, value: Any, 
                                    filename: str = None, line_no: int = None) -> WhyDidVariableHaveValue:
         """Create a question about why a variable had a specific value"""
-        return WhyDidVariableHaveValue(self.tracer, var_name, value, filename, line_no)
+        return self._question(WhyDidVariableHaveValue, var_name, value, filename, line_no)
     
     def why_did_function_return(self, func_name: str, return_value: Any) -> WhyDidFunctionReturn:
         """Create a question about why a function returned a specific value"""
-        return WhyDidFunctionReturn(self.tracer, func_name, return_value)
+        return self._question(WhyDidFunctionReturn, func_name, return_value)
     
     def why_was_function_called(self, func_name: str, call_context: str = None) -> WhyWasFunctionCalled:
         """Create a question about why a function was called"""
-        return WhyWasFunctionCalled(self.tracer, func_name, call_context)
+        return self._question(WhyWasFunctionCalled, func_name, call_context)
     
-    def why_didnt_field_change(self, field_name: str, after_time: float, 
+    def why_didnt_field_change(self, field_name: str, after_time: int, 
                               object_id: int = None) -> WhyDidntFieldChange:
         """Create a question about why a field didn't change after a certain time"""
-        return WhyDidntFieldChange(self.tracer, field_name, after_time, object_id)
+        return self._question(WhyDidntFieldChange, field_name, after_time, object_id)
     
     def why_did_object_get_created(self, object_type: str, object_id: int = None) -> WhyDidObjectGetCreated:
         """Create a question about why an object was created"""
-        return WhyDidObjectGetCreated(self.tracer, object_type, object_id)
+        return self._question(WhyDidObjectGetCreated, object_type, object_id)
     
     def why_did_property_get_assigned(self, property_name: str, value: Any, 
                                     object_id: int = None) -> WhyDidPropertyGetAssigned:
         """Create a question about why a property got assigned a specific value"""
-        return WhyDidPropertyGetAssigned(self.tracer, property_name, value, object_id)
+        return self._question(WhyDidPropertyGetAssigned, property_name, value, object_id)
     
     def why_did_condition_evaluate_to(self, condition_text: str, expected_result: bool,
                                     filename: str = None, line_no: int = None) -> WhyDidConditionEvaluateTo:
         """Create a question about why a condition evaluated to a specific boolean value"""
-        return WhyDidConditionEvaluateTo(self.tracer, condition_text, expected_result, filename, line_no)
\ No newline at end of file
+        return self._question(WhyDidConditionEvaluateTo, condition_text, expected_result, filename, line_no)
\ No newline at end of file
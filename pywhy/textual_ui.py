@@ -30,7 +30,8 @@ import inspect
 import traceback
 from pathlib import Path
 
-from .tracer import WhylineTracer, TraceEvent, get_tracer
+from .events import EventType, TraceEvent
+from .tracer import WhylineTracer, get_tracer
 from .questions import QuestionAsker, Question, Answer
 from .instrumenter import instrument_code, exec_instrumented
 
@@ -891,10 +892,13 @@ class WhylineApp(App):
         if not self.tracer.events:
             return ["No trace data available. Run code first."]
         
-        # Find interesting variables
+        events = self.tracer.events
+        
+        # Find interesting variables (augmented assignments are ASSIGN events too)
         variables = {}
-        for event in self.tracer.events:
-            if event.event_type in ['assign', 'aug_assign'] and event.data.get('var_name'):
+        for i in events.indices_where([EventType.ASSIGN]):
+            event = events[i]
+            if event.data.get('var_name'):
                 var_name = event.data.get('var_name')
                 value = event.data.get('value')
                 variables[var_name] = value
@@ -903,10 +907,8 @@ class WhylineApp(App):
         for var_name, value in list(variables.items())[:3]:  # Top 3 variables
             suggestions.append(f"Why did variable '{var_name}' have value '{value}'?")
         
-        # Find interesting lines
-        lines = set()
-        for event in self.tracer.events:
-            lines.add(event.lineno)
+        # Find interesting lines, straight from the line number column
+        lines = set(events.lineno)
         
         # Suggest line questions
         for line_no in sorted(lines)[:3]:  # First 3 lines
@@ -914,9 +916,9 @@ class WhylineApp(App):
         
         # Find function calls
         functions = set()
-        for event in self.tracer.events:
-            if event.event_type == 'function_entry' and event.data.get('func_name'):
-                func_name = event.data.get('func_name')
+        for i in events.indices_where([EventType.FUNCTION_ENTRY]):
+            func_name = events[i].data.get('func_name')
+            if func_name:
                 functions.add(func_name)
         
         # Suggest function questions
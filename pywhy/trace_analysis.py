@@ -3,8 +3,7 @@ Utilities for analyzing and matching trace events.
 Provides tools for filtering, counting, and validating trace event sequences.
 """
 from typing import List
-from .instrumenter import TraceEvent
-from .events import EventType
+from .events import EventType, TraceEvent
 
 
 class EventMatcher:
@@ -7,8 +7,7 @@ import difflib
 import re
 from typing import List, Tuple, Dict
 from dataclasses import dataclass
-from pywhy.tracer import TraceEvent
-from pywhy.events import EventType
+from pywhy.events import EventType, TraceEvent
 
 
 @dataclass
@@ -152,12 +151,18 @@ def format_trace(events: List[TraceEvent], title: str = "Trace", include_details
     Returns:
         Formatted string representation of the entire trace
     """
-    if not events:
+    return _join_formatted_trace(
+        [format_trace_event(event, include_details) for event in events], title
+    )
+
+
+def _join_formatted_trace(event_strs: List[str], title: str) -> str:
+    """Join already formatted event strings into a numbered trace listing."""
+    if not event_strs:
         return f"{title}:\n  <empty trace>\n"
     
     lines = [f"{title}:"]
-    for i, event in enumerate(events):
-        event_str = format_trace_event(event, include_details)
+    for i, event_str in enumerate(event_strs):
         lines.append(f"  {i+1:2}. {event_str}")
     
     return "\n".join(lines) + "\n"
@@ -179,9 +184,12 @@ def compare_traces(actual_events: List[TraceEvent],
     Returns:
         TraceComparison object with detailed comparison results
     """
-    # Format both traces
-    actual_trace_str = format_trace(actual_events, actual_title, include_details=False)
-    expected_trace_str = format_trace(expected_events, expected_title, include_details=False)
+    # Format every event once; the strings serve both the listings and the
+    # per-event comparison below
+    actual_strs = [format_trace_event(event, include_details=False) for event in actual_events]
+    expected_strs = [format_trace_event(event, include_details=False) for event in expected_events]
+    actual_trace_str = _join_formatted_trace(actual_strs, actual_title)
+    expected_trace_str = _join_formatted_trace(expected_strs, expected_title)
     
     # Generate diff
     actual_lines = actual_trace_str.splitlines(keepends=True)
@@ -202,10 +210,7 @@ def compare_traces(actual_events: List[TraceEvent],
     mismatch_details = []
     
     if matches:
-        for i, (actual, expected) in enumerate(zip(actual_events, expected_events)):
-            actual_formatted = format_trace_event(actual, include_details=False)
-            expected_formatted = format_trace_event(expected, include_details=False)
-            
+        for i, (actual_formatted, expected_formatted) in enumerate(zip(actual_strs, expected_strs)):
             if actual_formatted != expected_formatted:
                 matches = False
                 mismatch_details.append(
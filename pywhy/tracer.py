@@ -6,9 +6,20 @@ Inspired by the original Whyline's tracing system.
 import threading
 import inspect
 from typing import Any, List, Dict
-from collections import defaultdict
 import pickle
-from .events import EventType, TraceEvent
+from .events import EVENT_TYPES_BY_VALUE, EventStore, EventType, TraceEvent, reset_trace_epoch
+
+_MISSING = object()
+
+# Local that instrumented functions bind to _whyline_tracer.record_event, so
+# their tracer calls are a fast local lookup instead of a global plus attribute
+RECORD_EVENT_ALIAS = '_whyline_record_event'
+
+
+def _is_global_snapshot_entry(name: str, value: Any) -> bool:
+    """Whether a global belongs in event snapshots (skips dunders and callables)"""
+    return not name.startswith('__') and not callable(value)
+
 
 class WhylineTracer:
     """
@@ -20,14 +31,49 @@ class WhylineTracer:
         After injection and execution, the tracer can be used to retrieve the events for the given code. 
     """
     
+    # Number of pending events that triggers a batch move into the event store
+    FLUSH_THRESHOLD = 1024
+    # Most frames whose last locals snapshot is kept for reuse
+    LOCALS_SNAPSHOT_CACHE_SIZE = 256
+    
     def __init__(self):
-        self.events: List[TraceEvent] = []
+        self._events = EventStore()
+        # Recorded events not yet moved into the store; appended without the lock
+        self._pending: List[TraceEvent] = []
         self.event_id_counter = 0
         self.lock = threading.Lock()
         self.object_ids: Dict[id, int] = {}
         self.next_object_id = 1
         self.enabled = True
+        # Last snapshot handed out per frame (locals) and per module namespace
+        # (globals). Consecutive events share one dict until a binding changes.
+        # Locals entries are dropped when their frame returns, and the oldest
+        # are evicted past LOCALS_SNAPSHOT_CACHE_SIZE, so they can't pile up.
+        self._locals_snapshots: Dict[int, Dict[str, Any]] = {}
+        self._globals_snapshots: Dict[int, Dict[str, Any]] = {}
         
+    @property
+    def events(self) -> EventStore:
+        """All recorded events, including any still pending a flush"""
+        if self._pending:
+            self.flush()
+        return self._events
+    
+    @events.setter
+    def events(self, events: EventStore):
+        with self.lock:
+            self._pending.clear()
+            self._events = events
+    
+    def flush(self):
+        """Move pending events into the event store in one batch"""
+        with self.lock:
+            pending = self._pending
+            # Slice instead of swapping lists so appends racing with the flush are kept
+            count = len(pending)
+            self._events.extend(pending[:count])
+            del pending[:count]
+    
     def get_next_event_id(self) -> int:
         """Get the next unique event ID"""
         with self.lock:
@@ -42,16 +88,68 @@ class WhylineTracer:
             self.next_object_id += 1
         return self.object_ids[obj_id]
     
+    @staticmethod
+    def _snapshot(cache: Dict[int, Dict[str, Any]], key: int, namespace: Dict[str, Any],
+                  include=None) -> Dict[str, Any]:
+        """Get a snapshot of a namespace, reusing the previous one if nothing changed.
+        
+        Bindings are compared by identity, so this only walks the namespace; a new
+        dict is copied only when a name was added, removed or rebound.
+        """
+        previous = cache.get(key)
+        if previous is not None:
+            matched = 0
+            for name, value in namespace.items():
+                if include is not None and not include(name, value):
+                    continue
+                if previous.get(name, _MISSING) is not value:
+                    break
+                matched += 1
+            else:
+                if matched == len(previous):
+                    return previous
+        
+        if include is None:
+            snapshot = dict(namespace)
+        else:
+            snapshot = {name: value for name, value in namespace.items() if include(name, value)}
+        cache[key] = snapshot
+        return snapshot
+    
+    def _locals_snapshot(self, key: int, namespace: Dict[str, Any]) -> Dict[str, Any]:
+        """Like _snapshot for a frame's locals, leaving out the record_event alias.
+        
+        The alias is skipped by name inline, which is much cheaper per local
+        than an include callback.
+        """
+        previous = self._locals_snapshots.get(key)
+        if previous is not None:
+            matched = 0
+            for name, value in namespace.items():
+                if previous.get(name, _MISSING) is not value:
+                    if name == RECORD_EVENT_ALIAS:
+                        continue
+                    break
+                matched += 1
+            else:
+                if matched == len(previous):
+                    return previous
+        
+        snapshot = dict(namespace)
+        snapshot.pop(RECORD_EVENT_ALIAS, None)
+        cache = self._locals_snapshots
+        if previous is None and len(cache) >= self.LOCALS_SNAPSHOT_CACHE_SIZE:
+            # Dicts keep insertion order, so this is the longest-cached frame
+            del cache[next(iter(cache))]
+        cache[key] = snapshot
+        return snapshot
+    
     def record_event(self, event_id: int, filename: str, lineno: int, 
                     event_type, *args, **kwargs):
         """Record an instrumentation event"""
         if not self.enabled:
             return
-            
-        # Convert string event type to EventType enum if needed
-        if isinstance(event_type, str):
-            event_type = EventType(event_type)
-            
+        
         # Get the calling frame to access variables
         frame = inspect.currentframe()
         try:
@@ -62,37 +160,85 @@ class WhylineTracer:
             if frame is None:
                 return
             
-            # Build data dict from args and kwargs for unified structure
-            data = {}
-            if kwargs:
-                data.update(kwargs)
-            if args:
-                # Convert args tuple to proper data dictionary format
-                # Args come as: ('var_name', 'x', 'value', 10) -> {'var_name': 'x', 'value': 10}
-                for i in range(0, len(args), 2):
-                    if i + 1 < len(args):
-                        key = args[i]
-                        value = args[i + 1]
-                        data[key] = value
-                
-            event = TraceEvent(
-                event_id=event_id,
-                filename=filename,
-                lineno=lineno,
-                event_type=event_type,
-                data=data,
-                # Runtime context will be auto-populated by __post_init__
-                locals_snapshot=frame.f_locals.copy(),
-                globals_snapshot={k: v for k, v in frame.f_globals.items() 
-                                if not k.startswith('__') and not callable(v)}
-            )
+            self._record(frame, self._frame_snapshots(frame),
+                         event_id, filename, lineno, event_type, args, kwargs)
+        finally:
+            del frame
+    
+    def record_events(self, *events):
+        """Record several events raised back to back at one site, e.g. each target of
+        `a = b = value`. Each event is a tuple of record_event's positional arguments.
+        
+        Nothing runs between the events, so the frame and its snapshots are looked
+        up once for the whole batch.
+        """
+        if not self.enabled:
+            return
+        
+        frame = inspect.currentframe()
+        try:
+            while frame and frame.f_code.co_filename == __file__:
+                frame = frame.f_back
+            
+            if frame is None:
+                return
             
-            with self.lock:
-                self.events.append(event)
-                
+            snapshots = self._frame_snapshots(frame)
+            for event_id, filename, lineno, event_type, *args in events:
+                self._record(frame, snapshots, event_id, filename, lineno, event_type, args, None)
         finally:
             del frame
     
+    def _frame_snapshots(self, frame):
+        """Get the (locals, globals) snapshots for events raised in a frame"""
+        return (self._locals_snapshot(id(frame), frame.f_locals),
+                self._snapshot(self._globals_snapshots, id(frame.f_globals),
+                               frame.f_globals, _is_global_snapshot_entry))
+    
+    def _record(self, frame, snapshots, event_id: int, filename: str, lineno: int,
+                event_type, args, kwargs):
+        """Build one event from record_event's arguments and queue it"""
+        # Convert string event type to EventType enum if needed
+        if isinstance(event_type, str):
+            event_type = EVENT_TYPES_BY_VALUE.get(event_type) or EventType(event_type)
+        
+        # Build data dict from args and kwargs for unified structure
+        data = {}
+        if kwargs:
+            data.update(kwargs)
+        if args:
+            # Convert args tuple to proper data dictionary format
+            # Args come as: ('var_name', 'x', 'value', 10) -> {'var_name': 'x', 'value': 10}
+            for i in range(0, len(args), 2):
+                if i + 1 < len(args):
+                    key = args[i]
+                    value = args[i + 1]
+                    data[key] = value
+        
+        locals_snapshot, globals_snapshot = snapshots
+        event = TraceEvent(
+            event_id=event_id,
+            filename=filename,
+            lineno=lineno,
+            event_type=event_type,
+            data=data,
+            frame_id=id(frame),
+            # Runtime context will be auto-populated by __post_init__;
+            # snapshots are shared until they change and sanitized lazily on serialization
+            locals_snapshot=locals_snapshot,
+            globals_snapshot=globals_snapshot
+        )
+        
+        if event_type is EventType.RETURN:
+            # No more events come from a returning frame; its id may be reused
+            self._locals_snapshots.pop(id(frame), None)
+        
+        # list.append is atomic, so the hot path skips the lock and the
+        # store's per-event column updates; flush() does those in batches
+        self._pending.append(event)
+        if len(self._pending) >= self.FLUSH_THRESHOLD:
+            self.flush()
+    
     def get_variable_history(self, var_name: str, filename: str = None) -> List[TraceEvent]:
         """Get history of a variable's assignments"""
         history = []
@@ -105,40 +251,48 @@ class WhylineTracer:
     
     def get_line_executions(self, filename: str, lineno: int) -> List[TraceEvent]:
         """Get all events that occurred on a specific line"""
-        return [event for event in self.events 
-                if event.filename == filename and event.lineno == lineno]
+        linenos = self.events.lineno
+        return [self.events[i] for i in self.events.indices_where(filename=filename)
+                if linenos[i] == lineno]
     
     def get_function_calls(self, func_name: str = None) -> List[TraceEvent]:
         """Get all function call events"""
-        calls = []
-        for event in self.events:
-            if event.event_type in [EventType.FUNCTION_ENTRY, EventType.CALL]:
-                if func_name is None or event.get_func_name() == func_name:
-                    calls.append(event)
-        return calls
+        events = self.events
+        call_types = (EventType.FUNCTION_ENTRY, EventType.CALL)
+        if func_name is None:
+            return [events[i] for i in events.indices_where(call_types)]
+        return [events[i] for i in events.indices_for_func(func_name)
+                if events[i].event_type in call_types]
     
     def get_events_in_range(self, start_line: int, end_line: int, 
                            filename: str = None) -> List[TraceEvent]:
         """Get events within a line range"""
-        return [event for event in self.events
-                if start_line <= event.lineno <= end_line and
-                (filename is None or event.filename == filename)]
+        linenos = self.events.lineno
+        return [self.events[i] for i in self.events.indices_where(filename=filename)
+                if start_line <= linenos[i] <= end_line]
     
     def save_trace(self, filename: str):
         """Save trace to file"""
+        for event in self.events:
+            event.sanitize()
         with open(filename, 'wb') as f:
-            pickle.dump(self.events, f)
+            # Persist a plain list so trace files don't depend on the store layout
+            pickle.dump(self.events.copy(), f)
     
     def load_trace(self, filename: str):
         """Load trace from file"""
         with open(filename, 'rb') as f:
-            self.events = pickle.load(f)
+            self.events = EventStore(pickle.load(f))
     
     def clear(self):
         """Clear all recorded events"""
         with self.lock:
-            self.events.clear()
+            self._pending.clear()
+            self._events.clear()
             self.event_id_counter = 0
+            self._locals_snapshots.clear()
+            self._globals_snapshots.clear()
+            reset_trace_epoch()
     
     def enable(self):
         """Enable tracing"""
@@ -150,19 +304,13 @@ class WhylineTracer:
     
     def get_stats(self) -> Dict[str, Any]:
         """Get tracing statistics"""
-        event_types = defaultdict(int)
-        files = set()
-        
-        for event in self.events:
-            event_types[event.event_type] += 1
-            files.add(event.filename)
-        
+        timestamps = self.events.timestamp
         return {
             'total_events': len(self.events),
-            'event_types': dict(event_types),
-            'files_traced': len(files),
-            'time_span': (self.events[-1].timestamp - self.events[0].timestamp) 
-                        if self.events else 0
+            'event_types': self.events.count_by_type(),
+            'files_traced': len(self.events.filenames),
+            # Timestamps are integer nanoseconds; report the span in seconds
+            'time_span': (timestamps[-1] - timestamps[0]) / 1e9 if self.events else 0
         }
 
 
@@ -0,0 +1,159 @@
+"""
+Tests for the interactive command-line interface.
+Drives WhylineCLI commands with scripted input and checks the questions it asks.
+"""
+
+import cmd
+
+import pytest
+
+from pywhy.cli import WhylineCLI
+
+
+@pytest.fixture
+def cli(tracer, monkeypatch):
+    """Provide a CLI that has run a small program, with scripted prompt answers."""
+    cli = WhylineCLI()
+    cli.current_code = "x = 1\ny = x + 1\n"
+    cli.do_run("")
+
+    def answer(*responses):
+        replies = iter(responses)
+        monkeypatch.setattr("builtins.input", lambda prompt="": next(replies))
+
+    cli.answer = answer
+    return cli
+
+
+@pytest.mark.cli
+class TestAskValues:
+    """Test how typed values are parsed when asking questions."""
+
+    @pytest.mark.parametrize("value_str, expected", [
+        ("2", 2),
+        ("[1, 2]", [1, 2]),
+        ("hello", "hello"),
+        ("{[1]: 2}", "{[1]: 2}"),
+    ])
+    def test_value_falls_back_to_raw_string(self, cli, value_str, expected):
+        """Values that are not usable literals are asked about as typed."""
+        cli.answer("1", "y", value_str, "")
+        cli.onecmd("ask")
+
+        assert cli.questions[-1].value == expected
+
+    def test_function_return_value_falls_back_to_raw_string(self, cli):
+        """Function return questions parse values the same way."""
+        cli.answer("4", "f", "{[1]: 2}")
+        cli.onecmd("ask")
+
+        assert cli.questions[-1].return_value == "{[1]: 2}"
+
+
+@pytest.mark.cli
+class TestQuestionHistory:
+    """Test the history of asked questions."""
+
+    def test_repeated_question_is_listed_once(self, cli):
+        """Asking the same question again does not duplicate the history."""
+        cli.answer("1", "y", "2", "")
+        cli.onecmd("ask")
+        cli.answer("1", "y", "2", "")
+        cli.onecmd("ask")
+
+        assert len(cli.questions) == 1
+
+    def test_question_on_new_trace_is_listed_again(self, cli):
+        """After the code runs again, the same question is a new history entry."""
+        cli.answer("1", "y", "2", "")
+        cli.onecmd("ask")
+        cli.do_run("")
+        cli.answer("1", "y", "2", "")
+        cli.onecmd("ask")
+
+        assert len(cli.questions) == 2
+        assert cli.questions[0] is not cli.questions[1]
+
+
+@pytest.mark.cli
+class TestCommandDispatch:
+    """Test that the handler table dispatches like cmd.Cmd.onecmd."""
+
+    @pytest.mark.parametrize("line", [
+        "frobnicate",
+        "frobnicate with args",
+        "",
+        "help",
+        "help quit",
+        "? quit",
+        "EOF",
+        "quit",
+        "trace",
+        "load",
+    ])
+    def test_matches_default_dispatch(self, tracer, capsys, line):
+        """Return value, output and repeated-command state match the default lookup."""
+        cli = WhylineCLI()
+        cli.lastcmd = "trace"
+        result = cli.onecmd(line)
+        output = capsys.readouterr().out
+
+        reference = WhylineCLI()
+        reference.lastcmd = "trace"
+        expected = cmd.Cmd.onecmd(reference, line)
+
+        assert result == expected
+        assert output == capsys.readouterr().out
+        assert cli.lastcmd == reference.lastcmd
+
+    def test_unknown_command_reports_syntax_error(self, tracer, capsys):
+        """Unknown commands fall through to cmd.Cmd.default."""
+        assert not WhylineCLI().onecmd("frobnicate")
+        assert "Unknown syntax: frobnicate" in capsys.readouterr().out
+
+    def test_eof_exits_without_becoming_last_command(self, tracer, capsys):
+        """EOF stops the loop and is not repeated by an empty line."""
+        cli = WhylineCLI()
+        assert cli.onecmd("EOF") is True
+        assert cli.lastcmd == ""
+
+
+@pytest.mark.cli
+class TestEvidenceCompression:
+    """Test switching compressed answer evidence on and off."""
+
+    @pytest.fixture
+    def copy_cli(self, cli):
+        """A CLI whose program copies one value through a chain of assignments."""
+        cli.current_code = "x = 5\nx = x\nx = x\nx = x\n"
+        cli.do_run("")
+        return cli
+
+    def test_compress_is_off_by_default(self, copy_cli, capsys):
+        """Evidence is listed in full until compression is switched on."""
+        copy_cli.answer("1", "x", "5", "")
+        copy_cli.onecmd("ask")
+
+        assert "after compressing chains" not in capsys.readouterr().out
+
+    def test_compress_on_collapses_evidence(self, copy_cli, capsys):
+        """With compression on, the chain of copies is shown by its endpoints."""
+        copy_cli.onecmd("compress on")
+        copy_cli.answer("1", "x", "5", "")
+        copy_cli.onecmd("ask")
+        output = capsys.readouterr().out
+
+        assert "Evidence compression is on" in output
+        assert "Evidence (4 of 7 events after compressing chains)" in output
+
+        copy_cli.onecmd("compress off")
+        copy_cli.answer("1", "x", "5", "")
+        copy_cli.onecmd("ask")
+        assert "Evidence (7 events)" in capsys.readouterr().out
+
+    def test_compress_rejects_other_settings(self, copy_cli, capsys):
+        """Anything but on or off leaves the setting alone."""
+        copy_cli.onecmd("compress sometimes")
+
+        assert "Usage: compress on|off" in capsys.readouterr().out
+        assert copy_cli.compress_evidence is False
@@ -4,13 +4,20 @@ Tests the core instrumentation engine and verifies correct traces using DSL patt
 Ensures compatibility with Python 3.9+ features and edge cases up to Python 3.12.
 """
 
+import ast
+import marshal
 import pytest
 import time
 import sys
 
 
-from pywhy.instrumenter import exec_instrumented
+import pywhy.instrumenter as instrumenter_module
+from pywhy.instrumenter import (
+    WhylineInstrumenter, exec_instrumented, instrument_ast, instrument_code, instrument_file,
+    instrument_files
+)
 from pywhy.events import EventType
+from pywhy.tracer import RECORD_EVENT_ALIAS
 from pywhy.trace_dsl import trace
 from pywhy.trace_visualization import (
     format_trace, compare_traces, show_trace_diff, print_trace_comparison
@@ -401,6 +408,57 @@ for w in range(1):
         assert_variable_value_event(actual_events, "empty_total", 0)
         assert_variable_value_event(actual_events, "single_total", 0)
     
+    def test_unpacking_loop_instrumentation(self, tracer, instrumented_execution):
+        """
+        Test that for loops with tuple targets record the unpacked names and values.
+        """
+        code = """
+pairs = [(1, 'a'), (2, 'b')]
+for number, letter in pairs:
+    pass
+"""
+        instrumented_execution(code)
+        
+        iterations = [e for e in tracer.events if e.event_type == EventType.LOOP_ITERATION]
+        assert [e.data for e in iterations] == [
+            {'target': 'number, letter', 'iter_value': [1, 'a']},
+            {'target': 'number, letter', 'iter_value': [2, 'b']},
+        ]
+    
+    def test_starred_loop_target(self, tracer, instrumented_execution):
+        """
+        Test that a starred name in a for loop target is recorded with its list value.
+        """
+        code = """
+rows = [(1, 2, 3), (4, 5)]
+for head, *rest in rows:
+    pass
+"""
+        instrumented_execution(code)
+        
+        iterations = [e for e in tracer.events if e.event_type == EventType.LOOP_ITERATION]
+        assert [e.data for e in iterations] == [
+            {'target': 'head, rest', 'iter_value': [1, [2, 3]]},
+            {'target': 'head, rest', 'iter_value': [4, [5]]},
+        ]
+    
+    def test_nested_loop_target(self, tracer, instrumented_execution):
+        """
+        Test that names in nested tuple and list targets are recorded in order.
+        """
+        code = """
+items = [((1, 2), [3, 4]), ((5, 6), [7, 8])]
+for (a, b), [c, d] in items:
+    pass
+"""
+        instrumented_execution(code)
+        
+        iterations = [e for e in tracer.events if e.event_type == EventType.LOOP_ITERATION]
+        assert [e.data for e in iterations] == [
+            {'target': 'a, b, c, d', 'iter_value': [1, 2, 3, 4]},
+            {'target': 'a, b, c, d', 'iter_value': [5, 6, 7, 8]},
+        ]
+    
     def test_while_loop_instrumentation(self, tracer, instrumented_execution):
         """
         Test instrumentation of while loops using DSL verification.
@@ -551,6 +609,54 @@ obj.attr = 'test'
         assert_variable_value_event(actual_events, "n", 10)
         assert_variable_value_event(actual_events, "o", 10)
         assert_variable_value_event(actual_events, "counter", 5)  # initial value before augmented ops
+    
+    def test_skip_trivial_assignments(self):
+        """
+        Test that skip_trivial leaves constant literals bound to names untraced and traces the rest.
+        """
+        code = """
+x = 0
+LIMITS = (1, [2, 3], {'a': None})
+y = x + 1
+z = [x]
+"""
+        instrumented = ast.unparse(instrument_ast(code, skip_trivial=True))
+        
+        assert "'var_name', 'x'" not in instrumented
+        assert "'var_name', 'LIMITS'" not in instrumented
+        assert "'var_name', 'y'" in instrumented
+        assert "'var_name', 'z'" in instrumented
+    
+    def test_skip_trivial_through_code_and_exec(self, tracer):
+        """
+        Test that instrument_code and exec_instrumented pass skip_trivial on, and cache per setting.
+        """
+        code = "x = 0\ny = x + 1\n"
+        
+        assert "'var_name', 'x'" in instrument_code(code)
+        assert "'var_name', 'x'" not in instrument_code(code, skip_trivial=True)
+        assert "'var_name', 'x'" in instrument_code(code)
+        
+        namespace = exec_instrumented(code, skip_trivial=True)
+        assert namespace['x'] == 0
+        assert [e.data['var_name'] for e in tracer.events] == ['y']
+        
+        tracer.clear()
+        exec_instrumented(code)
+        assert [e.data['var_name'] for e in tracer.events] == ['x', 'y']
+    
+    def test_instrumentation_points_are_read_only(self):
+        """
+        Test that instrumentation points come back as a tuple describing each tracer call.
+        """
+        instrumenter = WhylineInstrumenter("points.py")
+        instrumenter.visit(ast.parse("x = 1\ny = x\n"))
+        
+        points = instrumenter.instrumentation_points
+        assert isinstance(points, tuple)
+        assert [(p.event_id, p.lineno, p.event_type) for p in points] == [
+            (1, 1, EventType.ASSIGN), (2, 2, EventType.ASSIGN)]
+        assert all(p.filename == "points.py" for p in points)
 
 
 @pytest.mark.unit
@@ -1477,6 +1583,23 @@ obj.x = obj.y = obj.z = 100
         # Verify specific assignments
         assert_variable_value_event(actual_events, "dynamic_value", "dynamic_value")
         assert_variable_value_event(actual_events, "computed_result", 20)
+    
+    def test_subscript_assignment_dependencies(self, tracer, instrumented_execution):
+        """
+        Test that subscript and slice assignments record the variables they read.
+        """
+        code = """
+items = [1, 2, 3]
+i = 1
+x = 10
+items[i] = x
+items[:i] = [x]
+"""
+        instrumented_execution(code)
+        
+        containers = [e for e in tracer.events
+                      if e.event_type == EventType.ASSIGN and 'container' in e.data]
+        assert [e.data['deps'] for e in containers] == [['i', 'items', 'x'], ['i', 'items', 'x']]
 
 
 @pytest.mark.unit
@@ -2151,6 +2274,50 @@ complex_dict = {(i, j): i*j for i in range(2) for j in range(2)}
         assert_variable_value_event(actual_events, "dict_comp", {0: 0, 2: 4, 4: 16})
         assert_variable_value_event(actual_events, "complex_result", 120)
         assert_variable_value_event(actual_events, "conditional_assign", 25)
+    
+    def test_main_guard_variants_execute(self, tracer, instrumented_execution):
+        """
+        Test that `__main__` guards run regardless of quoting, spacing, operand order or trailing comments.
+        """
+        code = """
+def main():
+    ran = True
+
+def reversed_main():
+    reversed_ran = True
+
+if __name__=='__main__':  # entry point
+    main()
+
+if "__main__" == __name__:
+    reversed_main()
+"""
+        instrumented_execution(code)
+        
+        actual_events = tracer.events
+        assert_function_called(actual_events, "main")
+        assert_variable_value_event(actual_events, "ran", True)
+        assert_function_called(actual_events, "reversed_main")
+        assert_variable_value_event(actual_events, "reversed_ran", True)
+        
+        # Both spellings are recognized as guards and rewritten on the AST
+        tree = instrument_ast(code, run_main_guards=True)
+        rewritten = [node for node in ast.walk(tree)
+                     if isinstance(node, ast.If) and isinstance(node.test, ast.Constant)]
+        assert len(rewritten) == 2
+    
+    def test_main_guard_branch_keeps_condition(self, tracer, capsys):
+        """
+        Test that a rewritten `__main__` guard records its real condition and dependencies.
+        """
+        exec_instrumented('if __name__ == "__main__":\n    ran = True\n')
+        
+        branch = next(e for e in tracer.events if e.event_type == EventType.BRANCH)
+        assert branch.data['condition'] == "__name__ == '__main__'"
+        assert branch.data['result'] is True
+        assert branch.data['decision'] == 'if_block'
+        assert branch.data['deps'] == ['__name__']
+        assert capsys.readouterr().out == ""
 
 
 @pytest.mark.unit
@@ -2343,4 +2510,232 @@ result = calc.add(3).multiply(2).get_value()
         assert 'calc.add' in deps, f"Should track 'calc.add' method in deps: {deps}"
         assert 'calc.multiply' in deps, f"Should track 'calc.multiply' method in deps: {deps}"
         assert 'calc.get_value' in deps, f"Should track 'calc.get_value' method in deps: {deps}"
-        assert result_event.data.get('value') == 16, "Result should be 16 ((5+3)*2)"
\ No newline at end of file
+        assert result_event.data.get('value') == 16, "Result should be 16 ((5+3)*2)"
+
+
+@pytest.mark.unit
+class TestTracerSnapshots:
+    """Test how the tracer captures locals and globals snapshots."""
+    
+    def test_unchanged_locals_share_snapshot(self, tracer, instrumented_execution):
+        """Consecutive events in a frame with unchanged locals share one snapshot."""
+        code = """
+def check(a):
+    if a > 0:
+        return a
+
+result = check(1)
+"""
+        instrumented_execution(code)
+        actual_events = tracer.events
+        
+        entry, branch, ret = actual_events[0], actual_events[1], actual_events[2]
+        assert entry.event_type == EventType.FUNCTION_ENTRY
+        assert branch.event_type == EventType.BRANCH
+        assert ret.event_type == EventType.RETURN
+        assert entry.locals_snapshot == {'a': 1}
+        assert branch.locals_snapshot is entry.locals_snapshot
+        assert ret.locals_snapshot is entry.locals_snapshot
+    
+    def test_changed_locals_get_new_snapshot(self, tracer, instrumented_execution):
+        """A rebinding produces a fresh snapshot and leaves earlier ones intact."""
+        code = """
+def count():
+    n = 1
+    n = 2
+    return n
+
+count()
+"""
+        instrumented_execution(code)
+        assigns = [e for e in tracer.events if e.event_type == EventType.ASSIGN]
+        
+        assert assigns[0].locals_snapshot == {'n': 1}
+        assert assigns[1].locals_snapshot == {'n': 2}
+        assert assigns[1].locals_snapshot is not assigns[0].locals_snapshot
+    
+    def test_returning_frames_leave_snapshot_cache(self, tracer, instrumented_execution):
+        """A frame's cached snapshot is dropped when the frame returns."""
+        code = """
+def ret(a):
+    return a
+
+for i in range(20):
+    ret(i)
+"""
+        instrumented_execution(code)
+        
+        module_frames = {e.frame_id for e in tracer.events if e.event_type == EventType.LOOP_ITERATION}
+        assert set(tracer._locals_snapshots) == module_frames
+    
+    def test_snapshot_cache_is_bounded(self, tracer, instrumented_execution, monkeypatch):
+        """Frames without a return event are evicted once the cache is full."""
+        code = """
+def implicit(a):
+    b = a
+
+def outer(a):
+    implicit(a)
+    c = a
+
+for i in range(20):
+    outer(i)
+"""
+        monkeypatch.setattr(tracer, 'LOCALS_SNAPSHOT_CACHE_SIZE', 2)
+        sizes = []
+        record = tracer._locals_snapshot
+        
+        def spy(key, namespace):
+            snapshot = record(key, namespace)
+            sizes.append(len(tracer._locals_snapshots))
+            return snapshot
+        
+        monkeypatch.setattr(tracer, '_locals_snapshot', spy)
+        instrumented_execution(code)
+        
+        assert len(sizes) == len(tracer.events)
+        assert max(sizes) == 2
+
+
+@pytest.mark.unit
+class TestInstrumentFiles:
+    """Test batch instrumentation of several files."""
+    
+    def test_instrument_files_writes_outputs(self, tmp_path):
+        """Each file is instrumented and written under output_dir with its relative layout."""
+        sources = {
+            'a.py': "x = 1\n",
+            'pkg/b.py': "def f(y):\n    return y\n",
+        }
+        paths = []
+        for name, code in sources.items():
+            path = tmp_path / 'src' / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(code)
+            paths.append(str(path))
+        
+        results = instrument_files(paths, output_dir=str(tmp_path / 'out'), workers=2)
+        
+        assert list(results) == paths
+        for path, (name, code) in zip(paths, sources.items()):
+            assert results[path] == instrument_code(code, path)
+            assert (tmp_path / 'out' / name).read_text() == results[path]
+    
+    def test_instrument_file_marshal_output(self, tracer, tmp_path):
+        """format='marshal' writes a standalone code object that runs with tracing."""
+        source = tmp_path / 'a.py'
+        source.write_text("x = 1\ny = x + 1\n")
+        output = tmp_path / 'a.bin'
+        
+        code = instrument_file(str(source), str(output), format='marshal')
+        
+        with open(output, 'rb') as f:
+            assert marshal.load(f) == code
+        namespace = {}
+        exec(code, namespace)
+        assert namespace['y'] == 2
+        assert_variable_value_event(tracer.events, "y", 2)
+    
+    def test_instrument_file_marshal_fallback(self, tracer, tmp_path, monkeypatch, capsys):
+        """A failed marshal instrumentation still returns and writes a code object."""
+        def fail(*args, **kwargs):
+            raise RuntimeError("boom")
+        
+        monkeypatch.setattr(instrumenter_module, 'instrument_ast', fail)
+        source = tmp_path / 'a.py'
+        source.write_text("x = 1\ny = x + 1\n")
+        output = tmp_path / 'a.bin'
+        
+        code = instrument_file(str(source), str(output), format='marshal')
+        
+        assert "Error instrumenting file" in capsys.readouterr().out
+        with open(output, 'rb') as f:
+            assert marshal.load(f) == code
+        namespace = {}
+        exec(code, namespace)
+        assert namespace['y'] == 2
+        assert len(tracer.events) == 0
+
+
+@pytest.mark.unit
+class TestGeneratedLocations:
+    """Test the source positions given to generated tracer code."""
+    
+    @staticmethod
+    def tracer_calls(tree):
+        """Get the generated record_event calls in an instrumented tree"""
+        return [node for node in ast.walk(tree)
+                if isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+                and node.func.id == RECORD_EVENT_ALIAS]
+    
+    def test_tracer_callees_use_their_own_lines(self):
+        """The record_event callee of each call sits on that call's line, in every module."""
+        instrument_ast("a = 1\nb = a\n", "first.py")
+        tree = instrument_ast("\n" * 40 + "def f(p):\n    q = p\n    return q\n", "second.py")
+        
+        calls = self.tracer_calls(tree)
+        assert calls
+        for call in calls:
+            assert call.func.lineno == call.lineno > 40
+        alias = tree.body[-1].body[0]
+        assert alias.targets[0].id == RECORD_EVENT_ALIAS
+        assert alias.value.lineno == alias.value.value.lineno == 41
+    
+    def test_compiled_lines_match_source(self, tracer):
+        """Instrumented code only reports lines of the original program to settrace."""
+        exec_instrumented("a = 1\nb = a\n")
+        code = "\n" * 40 + """x = 1
+y = x + 1
+if y > 1:
+    z = y
+else:
+    z = 0
+
+def double(p):
+    q = p * 2
+    return q
+
+for i in range(2):
+    w = double(i)
+"""
+        
+        def run_lines(run):
+            # Only frames of the program itself, which run in this namespace
+            namespace = {}
+            lines = set()
+            
+            def trace_lines(frame, event, arg):
+                if frame.f_globals is namespace and event == "line":
+                    lines.add(frame.f_lineno)
+                return trace_lines
+            
+            sys.settrace(trace_lines)
+            try:
+                run(namespace)
+            finally:
+                sys.settrace(None)
+            return lines
+        
+        original = run_lines(lambda namespace: exec(compile(code, "<string>", "exec"), namespace))
+        instrumented = run_lines(lambda namespace: exec_instrumented(code, namespace))
+        
+        assert len(tracer.events) > 0
+        assert instrumented == original
+    
+    def test_second_module_tracer_calls_use_its_lines(self):
+        """Every node of a generated tracer call is on its statement's line, in each module."""
+        sources = [
+            ("first.py", "a = 1\nif a:\n    b = a\n"),
+            ("second.py", "\n" * 30 + "x = 1\nif x > 0:\n    y = x\nz = [x, y]\n"),
+        ]
+        for filename, source in sources:
+            tree = instrument_ast(source, filename)
+            statement_lines = {node.lineno for node in ast.walk(ast.parse(source))
+                               if isinstance(node, ast.stmt)}
+            
+            calls = self.tracer_calls(tree)
+            assert calls
+            for call in calls:
+                assert call.lineno in statement_lines
+                assert {node.lineno for node in ast.walk(call)
+                        if 'lineno' in node._attributes} == {call.lineno}
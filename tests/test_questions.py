@@ -0,0 +1,199 @@
+"""
+Tests for the question and answer system.
+Builds traces with the DSL and verifies the answers and their evidence.
+"""
+
+import pytest
+
+from pywhy.events import EventType
+from pywhy.instrumenter import exec_instrumented
+from pywhy.questions import Answer, WhyDidVariableHaveValue, compress_event_chains
+from pywhy.trace_dsl import trace
+
+
+@pytest.mark.unit
+class TestEvidenceCompression:
+    """Test collapsing linear event chains in answer evidence."""
+
+    def test_linear_chain_keeps_endpoints(self):
+        """A run of assignments each copying the previous one collapses to its endpoints."""
+        events = (trace()
+                  .assign("a", 1)
+                  .assign("b", 1, deps=["a"])
+                  .assign("c", 1, deps=["b"])
+                  .assign("d", 1, deps=["c"])
+                  .build())
+
+        compressed = compress_event_chains(events, events)
+        assert compressed == [events[0], events[-1]]
+
+    def test_branches_and_frames_break_chains(self):
+        """Branch, entry and return events are kept and split chains."""
+        events = (trace()
+                  .assign("a", 1)
+                  .assign("b", 2, deps=["a"])
+                  .assign("c", 3, deps=["b"])
+                  .branch("c > 2", True, "if_block")
+                  .function_entry("f", [3])
+                  .assign("d", 4)
+                  .return_event(4)
+                  .build())
+
+        compressed = compress_event_chains(events, events)
+        assert compressed == [events[0], events[2], events[3], events[4], events[5], events[6]]
+        assert [e.event_type for e in compressed].count(EventType.BRANCH) == 1
+
+    def test_non_consecutive_events_are_not_chained(self):
+        """Events with gaps between their trace positions are not part of one chain."""
+        events = (trace()
+                  .assign("a", 1)
+                  .assign("b", 2, deps=["a"])
+                  .assign("c", 3, deps=["b"])
+                  .build())
+        sparse = [events[0], events[2]]
+
+        assert compress_event_chains(sparse, events) == sparse
+
+    def test_adjacent_sites_apart_in_trace_are_kept(self):
+        """Consecutive event ids do not make a chain when the events are apart in the trace."""
+        events = (trace()
+                  .assign("a", 1)
+                  .assign("x", 0)
+                  .assign("b", 2, deps=["a"])
+                  .assign("x", 0)
+                  .assign("c", 3, deps=["b"])
+                  .build())
+        evidence = [events[0], events[2], events[4]]
+        for event_id, event in enumerate(evidence, start=1):
+            event.event_id = event_id
+
+        assert compress_event_chains(evidence, events) == evidence
+
+    def test_frame_change_breaks_chain(self):
+        """Neighbouring trace events recorded in different frames are not chained."""
+        events = trace().assign("a", 1).assign("b", 2, deps=["a"]).assign("c", 3, deps=["b"]).build()
+        events[1].frame_id = 1
+        events[2].frame_id = 2
+
+        assert compress_event_chains(events, events) == events
+
+    def test_independent_neighbours_are_kept(self):
+        """Adjacent assignments that do not feed each other are not a chain."""
+        events = trace().assign("a", 1).assign("b", 2).assign("c", 3).build()
+
+        assert compress_event_chains(events, events) == events
+
+    def test_compressed_evidence_keeps_real_dependencies(self, tracer):
+        """Compression follows the recorded trace, so separate dependencies all stay."""
+        exec_instrumented("a = 1\nb = 2\nc = 3\nd = a + b + c\n")
+        question = WhyDidVariableHaveValue(tracer, "d", 6)
+        answer = question.get_answer()
+        answer.compress = True
+        evidence_vars = {e.data.get("var_name") for e in answer.display_evidence()}
+
+        assert {"a", "b", "c"} <= evidence_vars
+
+    def test_answer_compress_flag(self, tracer):
+        """Answers expose compressed evidence on request but keep the raw list."""
+        events = trace().assign("a", 1).assign("b", 2, deps=["a"]).assign("c", 3, deps=["b"]).build()
+        tracer.events.extend(events)
+
+        answer = Answer(question=WhyDidVariableHaveValue(tracer, "c", 3),
+                        explanation="", evidence=events)
+        assert answer.display_evidence() == events
+
+        answer.compress = True
+        assert answer.display_evidence() == [events[0], events[2]]
+        assert answer.evidence == events
+
+
+@pytest.mark.unit
+class TestWhyDidVariableHaveValue:
+    """Test answering why a variable had a value."""
+
+    def test_answer_uses_last_matching_assignment(self, tracer, question_asker):
+        """The answer points at the last assignment with the asked value and its deps."""
+        tracer.events.extend(trace()
+                             .assign("x", 1, line_no=1)
+                             .assign("y", 2, line_no=2)
+                             .assign("z", 3, deps=["x", "y"], line_no=3)
+                             .assign("x", 5, line_no=4)
+                             .assign("z", 3, deps=["x"], line_no=5)
+                             .build())
+
+        answer = question_asker.why_did_variable_have_value("z", 3).get_answer()
+
+        assert [e.lineno for e in answer.source_events] == [3, 5]
+        # Dependencies of the last assignment, in trace order
+        assert [e.lineno for e in answer.evidence[2:]] == [1, 4]
+
+    def test_unknown_variable(self, tracer, question_asker):
+        """Variables without assignments produce an empty answer."""
+        tracer.events.extend(trace().assign("x", 1).build())
+
+        answer = question_asker.why_did_variable_have_value("missing", 1).get_answer()
+
+        assert answer.source_events == []
+        assert "No assignment found" in answer.explanation
+
+
+@pytest.mark.unit
+class TestWhyWasFunctionCalled:
+    """Test answering why a function was called."""
+
+    def test_instrumented_calls_are_found(self, tracer, question_asker):
+        """Calls of an instrumented function are found with the branches taken before them."""
+        exec_instrumented("""
+def helper(v):
+    return v
+
+total = 0
+for i in range(3):
+    if i > 0:
+        total = total + helper(i)
+""")
+
+        answer = question_asker.why_was_function_called("helper").get_answer()
+
+        assert "was called 2 times" in answer.explanation
+        assert [e.event_type for e in answer.execution_events] == [EventType.FUNCTION_ENTRY] * 2
+        assert [e.data["args"] for e in answer.execution_events] == [[1], [2]]
+        # Branch events for i = 0, 1 and 2 all come before the last call
+        assert [e.event_type for e in answer.dependencies] == [EventType.BRANCH] * 3
+
+    def test_uncalled_function(self, tracer, question_asker):
+        """Functions that never ran are reported as never called."""
+        exec_instrumented("def unused():\n    return 1\n")
+
+        answer = question_asker.why_was_function_called("unused").get_answer()
+
+        assert "was never called" in answer.explanation
+
+
+@pytest.mark.unit
+class TestQuestionAskerMemoization:
+    """Test reusing questions and answers across a QuestionAsker session."""
+
+    def test_repeated_question_reuses_answer(self, tracer, question_asker):
+        """Asking the same question on an unchanged trace returns the analyzed question."""
+        tracer.events.extend(trace().assign("x", 1).build())
+
+        first = question_asker.why_did_variable_have_value("x", 1)
+        answer = first.get_answer()
+
+        assert question_asker.why_did_variable_have_value("x", 1) is first
+        assert first.get_answer() is answer
+        # Equal but differently typed values are different questions
+        assert question_asker.why_did_variable_have_value("x", True) is not first
+
+    def test_trace_change_invalidates_questions(self, tracer, question_asker):
+        """New events make the asker analyze the question again."""
+        tracer.events.extend(trace().assign("x", 1, line_no=1).build())
+        first = question_asker.why_did_variable_have_value("x", 1)
+        first.get_answer()
+
+        tracer.events.extend(trace().assign("x", 1, line_no=2).build())
+        second = question_asker.why_did_variable_have_value("x", 1)
+
+        assert second is not first
+        assert [e.lineno for e in second.get_answer().source_events] == [1, 2]
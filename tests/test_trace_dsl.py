@@ -6,6 +6,7 @@ Demonstrates how to create and test tracing events using the DSL.
 import pytest
 from pywhy.events import TraceEvent
 from pywhy.events import EventType
+from pywhy.events import EventStore
 from pywhy.trace_dsl import trace
 from pywhy.trace_analysis import EventMatcher
 
@@ -263,6 +264,113 @@ class TestTraceEvent:
         assert '"event_type": "assign"' in json_str
         assert '"var_name": "x"' in json_str
 
+    def test_snapshot_sanitization(self):
+        """Test that snapshots keep picklable values and mask the rest."""
+        event = TraceEvent(
+            event_id=1,
+            filename="test.py",
+            lineno=10,
+            event_type=EventType.ASSIGN,
+            locals_snapshot={
+                "x": 5,
+                "items": [1, "two", None],
+                "config": {"debug": True},
+                "gen": (i for i in range(3)),
+                "_whyline_tracer": object(),
+            },
+        )
+
+        # Snapshots stay raw until the event is serialized
+        assert "_whyline_tracer" in event.locals_snapshot
+
+        sanitized = event.to_dict()["locals_snapshot"]
+        assert sanitized["x"] == 5
+        assert sanitized["items"] == [1, "two", None]
+        assert sanitized["config"] == {"debug": True}
+        assert sanitized["gen"] == "<unpicklable: generator>"
+        assert "_whyline_tracer" not in sanitized
+
+
+@pytest.mark.unit
+class TestEventStore:
+    """Test the columnar EventStore."""
+
+    def test_list_like_access(self):
+        """Test that the store indexes, slices and iterates like a list."""
+        events = trace().assign("x", 1).assign("y", 2).assign("z", 3).build()
+        store = EventStore(events)
+
+        assert len(store) == 3
+        assert store[0] is events[0]
+        assert store[-2:] == events[-2:]
+        assert list(store) == events
+        assert store.copy() == events
+        assert store.recent(2) == events[-2:]
+        assert store.recent(0) == []
+
+        store.clear()
+        assert not store
+        assert len(store.lineno) == 0
+        assert store.filenames == []
+
+    def test_indices_after_unsorted_timestamps(self):
+        """Time windows stay correct when events arrive out of timestamp order."""
+        events = trace().assign("a", 1).assign("b", 2).assign("c", 3).assign("d", 4).build()
+        for event, timestamp in zip(events, [10, 30, 20, 40]):
+            event.timestamp = timestamp
+
+        sorted_store = EventStore([events[0], events[2], events[1], events[3]])
+        assert list(sorted_store.indices_after(15)) == [1, 2, 3]
+
+        store = EventStore(events[:2])
+        store.append(events[2])
+        store.extend(events[3:])
+        assert list(store.indices_after(15)) == [1, 2, 3]
+        assert list(store.indices_after(25)) == [1, 3]
+        assert list(store.indices_after(25, [0, 1, 2])) == [1]
+
+        store.clear()
+        store.extend(events[:2])
+        assert list(store.indices_after(25)) == [1]
+
+    def test_columns_and_queries(self):
+        """Test that the columns mirror the events and drive the queries."""
+        events = (
+            trace()
+            .set_filename("a.py")
+            .assign("x", 1, line_no=1)
+            .function_entry("f", [1], line_no=2)
+            .set_filename("b.py")
+            .branch("x > 0", True, "if_block", line_no=3)
+            .assign("y", 2, line_no=4)
+            .build()
+        )
+        store = EventStore(events)
+
+        assert list(store.lineno) == [1, 2, 3, 4]
+        assert store.filenames == ["a.py", "b.py"]
+        assert store.count_by_type() == {
+            EventType.ASSIGN: 2,
+            EventType.FUNCTION_ENTRY: 1,
+            EventType.BRANCH: 1,
+        }
+        assert store.indices_where([EventType.ASSIGN]) == [0, 3]
+        assert store.indices_where(filename="b.py") == [2, 3]
+        assert store.indices_where([EventType.ASSIGN], filename="a.py") == [0]
+        assert store.indices_where(filename="missing.py") == []
+        assert store.indices_for_var("x") == [0]
+        assert store.indices_for_var("missing") == []
+        assert store.indices_for_func("f") == [1]
+        assert store.indices_for_func("missing") == []
+        assert list(store.indices_after(-1)) == [0, 1, 2, 3]
+        assert list(store.indices_after(store.timestamp[-1])) == []
+        assert list(store.indices_after(-1, [0, 3])) == [0, 3]
+        # Several types merge back into trace order, and appends keep the index current
+        assert store.indices_where([EventType.BRANCH, EventType.FUNCTION_ENTRY]) == [1, 2]
+        assert store.indices_where([EventType.RETURN]) == []
+        store.append(trace().assign("z", 3).build()[0])
+        assert store.indices_where([EventType.ASSIGN]) == [0, 3, 4]
+
 
 @pytest.mark.dsl
 def test_full_workflow_example():